@@ -2,11 +2,12 @@
 # Import libraries
 # ========================================
 
-import folium
-import inflection
 import streamlit  as st
 
-from PIL import Image
+from dishy.lazy import lazy_import
+
+# Imported when first used, see dishy/lazy.py
+Image = lazy_import('PIL.Image')
 
 # ----------------- Start of the logical code structure -----------------
 
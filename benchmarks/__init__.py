@@ -0,0 +1,4 @@
+# ========================================
+# Dishy benchmarks
+# ========================================
+# Run from the repository root, e.g.  python -m benchmarks.bench_fx
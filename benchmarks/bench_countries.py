@@ -0,0 +1,64 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+
+from benchmarks.common import synthetic, timeit, print_table
+from dishy.cube        import DataCube
+from dishy.data        import load_dataset
+
+
+# What the Countries page aggregated before the metrics table: four
+# bar_plot_per_country calls and two horizontal_bar_plot calls, the latter
+# with a sum and a distinct count each.
+PER_CHART = [
+    ('city',             'nunique'),
+    ('restaurant_id',    'nunique'),
+    ('cuisines',         'nunique'),
+    ('votes',            'sum'),
+    ('votes',            'sum'),
+    ('restaurant_id',    'nunique'),
+    ('aggregate_rating', 'sum'),
+    ('restaurant_id',    'nunique'),
+]
+
+
+# ==========================================================
+#                       Functions
+# ==========================================================
+
+def per_chart(cube):
+    for column, op in PER_CHART:
+        cube.aggregate(['country_id'], column, op)
+
+
+def single_pass(cube):
+    cube.metrics(['country_id'])
+
+
+def count_passes(func, cube):
+    cube.passes = 0
+    func(cube)
+    return cube.passes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-chart vs single-pass Countries aggregates')
+    parser.add_argument('--rows', type=int, nargs='*', default=[100_000, 1_000_000],
+                        help='synthetic dataset sizes')
+    args = parser.parse_args()
+
+    base = load_dataset()
+    results = []
+    for n_rows in [len(base)] + args.rows:
+        df   = base if n_rows == len(base) else synthetic(base, n_rows)
+        cube = DataCube(df)
+        results.append([n_rows,
+                        count_passes(per_chart, cube), timeit(per_chart, cube),
+                        count_passes(single_pass, cube), timeit(single_pass, cube)])
+
+    print_table(results, ['rows', 'per_chart_passes', 'per_chart_s', 'single_passes', 'single_s'])
+
+
+if __name__ == '__main__':
+    main()
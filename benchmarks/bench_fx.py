@@ -0,0 +1,61 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+
+import pandas          as pd
+
+from benchmarks.common import load_raw, synthetic, timeit, print_table
+from dishy.cleaning    import currency_mapping, drop_single_value_columns, rename_columns
+from dishy.fx          import SnapshotRateProvider, to_usd
+
+
+# ==========================================================
+#                       Functions
+# ==========================================================
+
+def legacy_convert_to_usd(df, currency_column, currency_mapping, rates):
+    # The row-wise DataFrame.apply version that convert_to_usd replaced.
+    df_rates = pd.DataFrame(rates.items(), columns=['Currency', 'Rate'])
+    df_rates.set_index('Currency', inplace=True)
+    df['average_cost_for_two_USD'] = df.apply(lambda x: x['average_cost_for_two'] / df_rates.loc[currency_mapping[x[currency_column]], 'Rate'], axis=1)
+
+
+def vectorized_convert_to_usd(df, currency_column, currency_mapping, rates):
+    to_usd(df, 'average_cost_for_two', currency_column, currency_mapping, rates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Row-wise vs vectorized currency conversion')
+    parser.add_argument('--rows', type=int, nargs='*', default=[10_000_000],
+                        help='synthetic dataset sizes')
+    parser.add_argument('--legacy-max-rows', type=int, default=200_000,
+                        help='above this size the legacy timing is extrapolated linearly')
+    args = parser.parse_args()
+
+    rates = SnapshotRateProvider().fetch()
+    base  = rename_columns(drop_single_value_columns(load_raw()))
+
+    # Both implementations must agree before being compared.
+    a, b = base.copy(), base.copy()
+    legacy_convert_to_usd(a, 'currency', currency_mapping, rates)
+    vectorized_convert_to_usd(b, 'currency', currency_mapping, rates)
+    pd.testing.assert_series_equal(a['average_cost_for_two_USD'], b['average_cost_for_two_USD'])
+
+    results = []
+    for n_rows in [len(base)] + args.rows:
+        df = base if n_rows == len(base) else synthetic(base, n_rows)
+        vectorized = timeit(vectorized_convert_to_usd, df.copy(), 'currency', currency_mapping, rates)
+
+        legacy_rows = min(n_rows, args.legacy_max_rows)
+        sample      = df if legacy_rows == n_rows else df.iloc[:legacy_rows].copy()
+        legacy      = timeit(legacy_convert_to_usd, sample, 'currency', currency_mapping, rates, repeat=1)
+        legacy      = legacy * n_rows / legacy_rows
+        results.append([n_rows, legacy, vectorized, legacy / vectorized,
+                        'yes' if legacy_rows < n_rows else 'no'])
+
+    print_table(results, ['rows', 'apply_s', 'vectorized_s', 'speedup', 'apply_extrapolated'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+import os
+
+import pandas          as pd
+
+from benchmarks.common import load_raw, synthetic, timeit, print_table
+from dishy.cleaning    import clean_code
+from dishy.parallel    import clean_parallel
+
+
+# ==========================================================
+#                       Functions
+# ==========================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='clean_code vs clean_parallel from 1 to N workers')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='synthetic dataset size')
+    parser.add_argument('--workers', type=int, nargs='*', default=None,
+                        help='worker counts (default: powers of two up to the CPU count)')
+    args = parser.parse_args()
+
+    workers = args.workers
+    if not workers:
+        n_cpus  = os.cpu_count() or 1
+        workers = sorted({1, n_cpus} | {1 << i for i in range(n_cpus.bit_length()) if 1 << i <= n_cpus})
+
+    df = synthetic(load_raw(), args.rows)
+    serial = timeit(clean_code, df, repeat=1)
+    expected = clean_code(df)
+
+    results = [['clean_code', 1, serial, 1.0]]
+    for n in workers:
+        pd.testing.assert_frame_equal(clean_parallel(df, n), expected)
+        seconds = timeit(clean_parallel, df, n, repeat=1)
+        results.append(['clean_parallel', n, seconds, serial / seconds])
+
+    print('{} rows, {} CPUs'.format(args.rows, os.cpu_count()))
+    print_table(results, ['pipeline', 'workers', 'seconds', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
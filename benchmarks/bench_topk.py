@@ -0,0 +1,44 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+
+from benchmarks.common import synthetic, timeit, print_table
+from dishy.data        import load_dataset
+from dishy.topk        import top_k
+
+
+BY = ['aggregate_rating', 'votes']
+
+
+# ==========================================================
+#                       Functions
+# ==========================================================
+
+def full_sort(df, k):
+    return df.sort_values(by=BY, ascending=[False, False]).head(k)
+
+
+def partial_selection(df, k):
+    return top_k(df, BY, k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full sort vs partial selection for table_top_15')
+    parser.add_argument('--rows', type=int, nargs='*', default=[1_000_000, 10_000_000],
+                        help='synthetic dataset sizes')
+    parser.add_argument('-k', type=int, default=15)
+    args = parser.parse_args()
+
+    base = load_dataset()
+    results = []
+    for n_rows in [len(base)] + args.rows:
+        df = base if n_rows == len(base) else synthetic(base, n_rows)
+        assert full_sort(df, args.k).index.equals(partial_selection(df, args.k).index)
+        results.append([n_rows, timeit(full_sort, df, args.k), timeit(partial_selection, df, args.k)])
+
+    print_table(results, ['rows', 'sort_s', 'top_k_s'])
+
+
+if __name__ == '__main__':
+    main()
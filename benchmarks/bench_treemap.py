@@ -0,0 +1,76 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+import json
+
+import plotly.express  as px
+import plotly.io       as pio
+
+from benchmarks.common import page_functions, synthetic, timeit, print_table
+from dishy.aggregates  import aggregate_cache
+from dishy.cleaning    import uncategorize
+from dishy.cube        import DataCube, store_data_cube
+from dishy.data        import load_dataset
+from dishy.figures     import figure_cache
+from dishy.filters     import apply_filters
+
+
+# ==========================================================
+#                       Functions
+# ==========================================================
+
+def row_level_treemap(df):
+    # The treemap before pre-aggregation: Plotly Express counts every row
+    fig = px.treemap(uncategorize(df), path=[px.Constant('all'), 'country_id', 'cuisines'],
+                     color_continuous_scale='Blues', title='Restaurant Distribution')
+    fig.update_layout(margin=dict(t=20, l=10, r=10, b=10), height=600)
+    return fig
+
+
+def filtered(df, version):
+    # A frame as the page sees it: filtered, with its filter state and its
+    # data cube cached
+    df = df.copy(deep=False)
+    df.attrs['version'] = version
+    store_data_cube(version, DataCube(df))
+    return apply_filters(df, df['country_id'].unique().tolist(), df['price_type'].unique().tolist(),
+                         (float(df['aggregate_rating'].min()), float(df['aggregate_rating'].max())))
+
+
+def cold(func, *args):
+    aggregate_cache.clear()
+    figure_cache.clear()
+    return func(*args)
+
+
+def payload(fig):
+    spec = pio.to_json(fig, validate=False)
+    return len(spec), len(json.loads(spec)['data'][0]['ids'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Row-level vs pre-aggregated cuisine treemap')
+    parser.add_argument('--scales', type=int, nargs='*', default=[1, 10, 100],
+                        help='dataset sizes as multiples of the real dataset')
+    parser.add_argument('-n', type=int, default=15, help='cuisines kept per country')
+    args = parser.parse_args()
+
+    treemap_plot = page_functions(4)['treemap_plot']
+    base = load_dataset()
+    results = []
+    for scale in args.scales:
+        df, state = filtered(base if scale == 1 else synthetic(base, len(base) * scale),
+                             'bench-treemap-{}'.format(scale))
+        old_bytes, old_nodes = payload(row_level_treemap(df))
+        new_bytes, new_nodes = payload(cold(treemap_plot, df, state, args.n))
+        results.append([len(df), timeit(row_level_treemap, df, repeat=1 if scale >= 100 else 3),
+                        timeit(cold, treemap_plot, df, state, args.n), timeit(treemap_plot, df, state, args.n),
+                        old_nodes, new_nodes, old_bytes / 1024, new_bytes / 1024])
+
+    print_table(results, ['rows', 'row_level_s', 'aggregated_s', 'cached_s',
+                          'row_level_nodes', 'aggregated_nodes', 'row_level_kB', 'aggregated_kB'])
+
+
+if __name__ == '__main__':
+    main()
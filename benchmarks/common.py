@@ -0,0 +1,50 @@
+# ========================================
+# Import libraries
+# ========================================
+import glob
+import time
+
+import numpy          as np
+import pandas         as pd
+
+from dishy.data       import DATASET_PATH
+
+
+# ==========================================================
+#                       Functions
+# ==========================================================
+
+def load_raw(path=DATASET_PATH):
+    return pd.read_csv(path)
+
+
+def synthetic(df, n_rows, seed=42):
+    # Scale a frame up (or down) by sampling its rows with replacement, so
+    # the value distributions stay those of the real dataset.
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(df), size=n_rows)
+    return df.iloc[rows].reset_index(drop=True)
+
+
+def timeit(func, *args, repeat=3, **kwargs):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def print_table(rows, columns):
+    print(pd.DataFrame(rows, columns=columns).to_string(index=False))
+
+
+def page_functions(prefix):
+    # The imports and functions of a page script (everything above its
+    # logical code structure), without running the page itself.
+    path   = glob.glob('pages/{}_*.py'.format(prefix))[0]
+    source = open(path, encoding='utf-8').read()
+    source = source[:source.index('# ----------------- Start of the logical code structure')]
+    namespace = {'__name__': 'page_{}'.format(prefix)}
+    exec(compile(source, path, 'exec'), namespace)
+    return namespace
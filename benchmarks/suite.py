@@ -0,0 +1,207 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import folium
+import numpy           as np
+import pandas          as pd
+
+from benchmarks.common import load_raw, page_functions, synthetic, timeit, print_table
+from dishy.aggregates  import aggregate_cache
+from dishy.cleaning    import (clean_code, color_name, convert_to_usd, country_info, currency_mapping,
+                               drop_outliers, drop_single_value_columns, first_cuisine, price_type,
+                               rename_columns, transform_columns)
+from dishy.cube        import DataCube, store_data_cube
+from dishy.dedup       import drop_duplicate_rows
+from dishy.figures     import figure_cache
+from dishy.filters     import FilterIndex, apply_filters
+from dishy.fx          import get_rates
+from dishy.maps        import MAX_MARKERS, cluster_layer, viewport_clusters
+from dishy.schema      import compact
+from dishy.tiles       import PointPyramid, rows_mask
+
+
+SCALES      = [1, 10, 100, 1000]
+# Default output directory, gitignored; --output writes anywhere else
+RESULTS_DIR = 'benchmarks/results'
+# A stage this much slower than in the baseline is reported as a regression
+REGRESSION_THRESHOLD = 1.25
+
+
+# ==========================================================
+#                        Stages
+# ==========================================================
+# Every stage is a function of the per-scale context, timed on its own.
+# The context holds the intermediate results the stages start from, so a
+# stage only measures itself (e.g. convert_to_usd gets renamed rows, the
+# charts get the filtered table).
+
+def data_stages():
+    return [
+        ('csv_load',                  lambda c: pd.read_csv(c['csv'])),
+        ('clean_code',                lambda c: clean_code(c['raw'])),
+        ('drop_single_value_columns', lambda c: drop_single_value_columns(c['raw'])),
+        ('rename_columns',            lambda c: rename_columns(c['dropped'])),
+        ('country_info',              lambda c: country_info(c['renamed']['country_code'])),
+        ('price_type',                lambda c: price_type(c['renamed']['price_range'])),
+        ('color_name',                lambda c: color_name(c['renamed']['rating_color'])),
+        ('first_cuisine',             lambda c: first_cuisine(c['renamed']['cuisines'])),
+        ('convert_to_usd',            lambda c: convert_to_usd(c['renamed'].copy(deep=False), 'currency',
+                                                               currency_mapping, c['rates'])),
+        ('drop_duplicate_rows',       lambda c: drop_duplicate_rows(c['transformed'])),
+        ('drop_outliers',             lambda c: drop_outliers(c['transformed'])),
+        ('compact',                   lambda c: compact(c['transformed'])),
+        ('filter_index',              lambda c: FilterIndex(c['clean'])),
+        ('apply_filters',             lambda c: apply_filters(c['clean'], *c['filters'])),
+        ('data_cube',                 lambda c: DataCube(c['clean'])),
+    ]
+
+
+def chart(func):
+    # Charts memoize their aggregates and figures; time them from empty caches
+    def run(c):
+        aggregate_cache.clear()
+        figure_cache.clear()
+        return func(c)
+    return run
+
+
+def chart_stages(pages):
+    countries, cities, restaurants = pages[2], pages[3], pages[4]
+    return [
+        ('country_metrics',       chart(lambda c: countries['country_metrics'](c['filtered'], c['state']))),
+        ('bar_plot_per_country',  chart(lambda c: countries['bar_plot_per_country'](
+                                      countries['country_metrics'](c['filtered'], c['state']),
+                                      'n_restaurant', '#_restaurant'))),
+        ('horizontal_bar_plot',   chart(lambda c: countries['horizontal_bar_plot'](
+                                      countries['country_metrics'](c['filtered'], c['state']),
+                                      'votes_per_restaurant', 'reviews_per_rest'))),
+        ('sunburst_plot',         chart(lambda c: countries['sunburst_plot'](c['filtered'], c['state']))),
+        ('bar_plot_per_city',     chart(lambda c: cities['bar_plot_per_city'](
+                                      c['filtered'], c['state'], 'restaurant_id', 'n_restaurant', 'count'))),
+        ('bar_plot',              chart(lambda c: restaurants['bar_plot'](
+                                      c['filtered'], c['state'], 'cuisines', 'cuisines',
+                                      'average_cost_for_two_USD', 'US$', 'mean'))),
+        ('table_top_15',          chart(lambda c: restaurants['table_top_15'](c['filtered'], c['state']))),
+        ('scatter_plot',          chart(lambda c: restaurants['scatter_plot'](c['filtered'], c['state']))),
+        ('treemap_plot',          chart(lambda c: restaurants['treemap_plot'](c['filtered'], c['state']))),
+        ('countries_map',         lambda c: countries['overview_map'](c['filtered'])),
+        ('overview_map',          lambda c: overview_map(pages[1], c)),
+    ]
+
+
+def overview_map(page, c):
+    # The Overview page reads the pyramid of the live dataset for large
+    # tables, so that branch is rebuilt here from the benchmark table.
+    if len(c['filtered']) <= MAX_MARKERS:
+        return page['overview_map'](c['filtered'], c['state'], c['clean'])
+    pyramid  = PointPyramid(c['clean']['latitude'].to_numpy(), c['clean']['longitude'].to_numpy())
+    clusters = viewport_clusters(pyramid, 2, mask=rows_mask(c['filtered'], len(c['clean'])))
+    m = folium.Map(max_bounds=True, zoom_start=2)
+    cluster_layer(clusters).add_to(m)
+    return m.get_root().render()
+
+
+# ==========================================================
+#                      Running
+# ==========================================================
+
+def context_for(raw, csv_path):
+    c = {'raw': raw, 'csv': csv_path, 'rates': get_rates()}
+    c['dropped']     = drop_single_value_columns(raw)
+    c['renamed']     = rename_columns(c['dropped'])
+    c['transformed'] = transform_columns(c['renamed'].copy(), c['rates'])
+    c['clean']       = clean_code(raw)
+    c['clean'].attrs['version'] = 'benchmark-{}'.format(len(raw))
+    clean = c['clean']
+    c['filters'] = (clean['country_id'].unique().tolist(), clean['price_type'].unique().tolist(),
+                    (float(clean['aggregate_rating'].min()), float(clean['aggregate_rating'].max())))
+    c['filtered'], c['state'] = apply_filters(clean, *c['filters'])
+    store_data_cube(clean.attrs['version'], DataCube(clean))
+    return c
+
+
+def run(scales, stage_filter=None, repeat=3):
+    base  = load_raw()
+    pages = {prefix: page_functions(prefix) for prefix in (1, 2, 3, 4)}
+    stages = data_stages() + chart_stages(pages)
+    if stage_filter:
+        stages = [(name, func) for name, func in stages if any(part in name for part in stage_filter)]
+
+    results = []
+    for scale in scales:
+        raw = base if scale == 1 else synthetic(base, len(base) * scale)
+        # Resampled rows get their own ids, or deduplication would bring
+        # every scale back to the size of the real dataset
+        raw = raw.assign(**{'Restaurant ID': np.arange(len(raw))}) if scale > 1 else raw
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'zomato.csv')
+            raw.to_csv(csv_path, index=False)
+            c = context_for(raw, csv_path)
+            for name, func in stages:
+                seconds = timeit(func, c, repeat=repeat if scale < 100 else 1)
+                results.append({'stage': name, 'scale': scale, 'rows': len(raw), 'seconds': seconds})
+                print('{:>5}x  {:<26} {:10.4f} s'.format(scale, name, seconds), flush=True)
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'pandas': pd.__version__, 'numpy': np.__version__}
+
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    # Prints the stages present in both runs; returns the regressions
+    with open(baseline_path) as f:
+        baseline = {(r['stage'], r['scale']): r['seconds'] for r in json.load(f)['results']}
+    rows = []
+    for r in results:
+        before = baseline.get((r['stage'], r['scale']))
+        if before:
+            ratio = r['seconds'] / before
+            rows.append([r['stage'], r['scale'], before, r['seconds'], ratio,
+                         'REGRESSION' if ratio > threshold else ''])
+    print_table(rows, ['stage', 'scale', 'baseline_s', 'current_s', 'ratio', ''])
+    return [row for row in rows if row[-1]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every stage of the data and rendering pipeline')
+    parser.add_argument('--scales', type=int, nargs='*', default=SCALES,
+                        help='dataset sizes as multiples of the real dataset')
+    parser.add_argument('--stages', nargs='*', default=None,
+                        help='only run the stages whose name contains one of these')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs (1 from 100x)')
+    parser.add_argument('--output', default=None, help='JSON file for the results')
+    parser.add_argument('--compare', default=None, help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    results = run(args.scales, args.stages, args.repeat)
+    output  = args.output or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'metadata': metadata(), 'results': results}, f, indent=2)
+    print('Results written to', output)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            raise SystemExit('{} stage(s) slower than the baseline'.format(len(regressions)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+# ========================================
+# Dishy shared data layer
+# ========================================
+# Code shared by every page of the dashboard lives in this package, so
+# that each page only keeps the charts and the layout it renders.
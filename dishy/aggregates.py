@@ -0,0 +1,83 @@
+# ========================================
+# Import libraries
+# ========================================
+import threading
+
+from collections      import OrderedDict
+
+
+AGGREGATE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+# ==========================================================
+#                     Aggregate cache
+# ==========================================================
+# The chart aggregates only depend on the dataset version and on the
+# sidebar selection, so they are memoized under
+#   (aggregate name, dataset version, normalized filter tuple)
+# in a process-wide LRU bounded by the memory of the cached results.
+
+def normalize_filters(countries, price_types, rating_range):
+    return (tuple(sorted(countries)),
+            tuple(sorted(price_types)),
+            (float(rating_range[0]), float(rating_range[1])))
+
+
+def result_size(result):
+    if hasattr(result, 'memory_usage'):
+        usage = result.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    return 1024
+
+
+class AggregateCache:
+    def __init__(self, max_bytes=AGGREGATE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.n_bytes   = 0
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+        self._entries  = OrderedDict()
+        self._lock     = threading.Lock()
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        result = compute()
+        size   = result_size(result)
+        with self._lock:
+            if size <= self.max_bytes and key not in self._entries:
+                self._entries[key] = (result, size)
+                self.n_bytes += size
+                while self.n_bytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.n_bytes   -= evicted
+                    self.evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.n_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+aggregate_cache = AggregateCache()
+
+
+def cached_aggregate(state, name, compute):
+    # state is the filter state returned by dishy.filters.apply_filters
+    # (dataset version + selection) of the rows compute() aggregates; with
+    # no state (None) the result is computed without caching.
+    if state is None:
+        return compute()
+    return aggregate_cache.get((name,) + state, compute)
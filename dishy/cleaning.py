@@ -0,0 +1,170 @@
+# ========================================
+# Import libraries
+# ========================================
+import inflection
+import pandas         as pd
+
+from dishy.dedup      import drop_duplicate_rows
+from dishy.fx         import to_usd
+from dishy.schema     import compact
+
+
+# ==========================================================
+#                       Functions
+# ==========================================================
+
+def rename_columns(dataframe):
+    df = dataframe.copy()
+    title      = lambda x: inflection.titleize(x)
+    snakecase  = lambda x: inflection.underscore(x)
+    spaces     = lambda x: x.replace(" ", "")
+    cols_old   = list(df.columns)
+    cols_old   = list(map(title, cols_old))
+    cols_old   = list(map(spaces, cols_old))
+    cols_new   = list(map(snakecase, cols_old))
+    df.columns = cols_new
+    return df
+
+
+COUNTRIES_ISO = {
+    1:  {"country_id": "India",                     "iso_alpha": "IND"},
+    14: {"country_id": "Australia",                 "iso_alpha": "AUS"},
+    30: {"country_id": "Brazil",                    "iso_alpha": "BRA"},
+    37: {"country_id": "Canada",                    "iso_alpha": "CAN"},
+    94: {"country_id": "Indonesia",                 "iso_alpha": "IDN"},
+    148: {"country_id": "New Zealand",              "iso_alpha": "NZL"},
+    162: {"country_id": "Philippines",              "iso_alpha": "PHL"},
+    166: {"country_id": "Qatar",                    "iso_alpha": "QAT"},
+    184: {"country_id": "Singapore",                "iso_alpha": "SGP"},
+    189: {"country_id": "South Africa",             "iso_alpha": "ZAF"},
+    191: {"country_id": "Sri Lanka",                "iso_alpha": "LKA"},
+    208: {"country_id": "Turkey",                   "iso_alpha": "TUR"},
+    214: {"country_id": "United Arab Emirates",     "iso_alpha": "ARE"},
+    215: {"country_id": "United Kingdom",           "iso_alpha": "GBR"},
+    216: {"country_id": "United States of America", "iso_alpha": "USA"},
+}
+COUNTRY_NAMES = {code: info["country_id"] for code, info in COUNTRIES_ISO.items()}
+COUNTRY_ISO   = {code: info["iso_alpha"]  for code, info in COUNTRIES_ISO.items()}
+# Categories are kept in alphabetical order, so groupby and sort results
+# come out in the same order as with the plain string columns.
+COUNTRY_DTYPE = pd.CategoricalDtype(sorted(COUNTRY_NAMES.values()))
+ISO_DTYPE     = pd.CategoricalDtype(sorted(COUNTRY_ISO.values()))
+
+
+def country_info(country_code):
+    country_id = country_code.map(COUNTRY_NAMES).astype(COUNTRY_DTYPE)
+    iso_alpha  = country_code.map(COUNTRY_ISO).astype(ISO_DTYPE)
+    return country_id, iso_alpha
+
+
+PRICE_TYPES = {
+    1: "cheap",
+    2: "normal",
+    3: "expensive",
+    }
+PRICE_TYPE_DTYPE = pd.CategoricalDtype(sorted(["cheap", "normal", "expensive", "gourmet"]))
+def price_type(price_range):
+    # Anything that is not 1, 2 or 3 is "gourmet"
+    return price_range.map(PRICE_TYPES).fillna("gourmet").astype(PRICE_TYPE_DTYPE)
+
+
+COLORS = {
+    "3F7E00": "darkgreen",
+    "5BA829": "green",
+    "9ACD32": "lightgreen",
+    "CDD614": "pear",
+    "FFBA00": "darkyellow",
+    "CBCBC8": "silver",
+    "FF7800": "orange",
+    }
+COLOR_DTYPE = pd.CategoricalDtype(sorted(COLORS.values()))
+def color_name(color_code):
+    return color_code.map(COLORS).astype(COLOR_DTYPE)
+
+
+def first_cuisine(cuisines):
+    # Keep only the first cuisine listed for each restaurant
+    first = cuisines.astype(str).str.split(",", n=1, expand=True)[0]
+    return first.astype('category')
+
+
+currency_mapping = {
+    "Botswana Pula(P)":       "BWP",
+    "Brazilian Real(R$)":     "BRL",
+    "Dollar($)":              "USD",
+    "Emirati Diram(AED)":     "AED",
+    "Indian Rupees(Rs.)":     "INR",
+    "Indonesian Rupiah(IDR)": "IDR",
+    "NewZealand($)":          "NZD",
+    "Pounds(£)":              "GBP",
+    "Qatari Rial(QR)":        "QAR",
+    "Rand(R)":                "ZAR",
+    "Sri Lankan Rupee(LKR)":  "LKR",
+    "Turkish Lira(TL)":       "TRY"
+}
+def convert_to_usd(df, currency_column, currency_mapping, rates=None):
+    # Rates come from the offline-first cache in dishy/fx.py, so cleaning
+    # never waits on exchangerate-api.com and always creates the column.
+    to_usd(df, 'average_cost_for_two', currency_column, currency_mapping, rates)
+
+
+def count_unique_values(df):
+    unique_counts = df.nunique().reset_index()
+    unique_counts.columns = ['Column', 'Unique Count']
+    return unique_counts
+
+
+def drop_single_value_columns(df):
+    unique_counts = count_unique_values(df)
+    single_value_columns = unique_counts[unique_counts['Unique Count'] == 1]['Column']
+    return df.drop(single_value_columns, axis=1)
+
+
+def check_nulls(df):
+    nulls_per_column = df.isnull().sum()
+    total_values_per_column = df.shape[0]
+    percent_null_per_column = (nulls_per_column / total_values_per_column) * 100
+    return pd.DataFrame({'Column': nulls_per_column.index,
+                         'Percent_nulls': percent_null_per_column.values})
+
+
+# Rows whose cost for two is above this are dropped as outliers
+MAX_COST_FOR_TWO = 400000
+
+
+def transform_columns(df, rates=None):
+    # The row-wise cleaning steps: every row is cleaned on its own, so
+    # chunks of the file can go through them independently (dishy.ingest).
+    df["country_id"], df["ISO_Alpha"] = country_info(df["country_code"])
+    df['price_type'] = price_type(df.price_range)
+    df['rating_color'] = color_name(df.rating_color)
+    df['restaurant_id'] = df['restaurant_id'].astype(str)
+    df['city'] = df['city'].astype('category')
+    convert_to_usd(df, 'currency', currency_mapping, rates)
+    df['cuisines'] = first_cuisine(df.cuisines)
+    return df
+
+
+def drop_outliers(df):
+    return df.drop(df[df.average_cost_for_two > MAX_COST_FOR_TWO].index)
+
+
+def clean_code(df, stats=None, rates=None):
+    # stats, when given, receives the number of duplicate rows dropped
+    df = drop_single_value_columns(df)
+    df = rename_columns(df)
+    df = transform_columns(df, rates)
+    df, n_duplicates = drop_duplicate_rows(df)
+    if stats is not None:
+        stats['duplicates'] = n_duplicates
+    df = drop_outliers(df)
+    df = df.reset_index(drop=True)
+    df = compact(df)
+    return df
+
+
+def uncategorize(df):
+    # Plotly Express groups on every category of a categorical column, even
+    # the ones filtered out, so chart inputs get plain object columns back.
+    columns = df.select_dtypes('category').columns
+    return df.astype({column: object for column in columns})
@@ -0,0 +1,340 @@
+# ========================================
+# Import libraries
+# ========================================
+import copy
+import threading
+
+import numpy          as np
+import pandas         as pd
+
+from dishy.cleaning   import uncategorize
+
+
+RATING_STEP   = 0.1
+HLL_PRECISION = 10
+DIMENSIONS    = ['country_id', 'city', 'price_type', 'cuisines', 'rating_bucket']
+
+
+# ==========================================================
+#                 Distinct restaurant sketches
+# ==========================================================
+# Distinct restaurants cannot be summed across cells, so every cell keeps
+# the restaurant_id hashes of its rows as sparse (cell, hash) pairs and the
+# distinct counts of a roll-up are exact. Only when a cube holds more than
+# EXACT_DISTINCT_PAIRS pairs are they reduced to HyperLogLog entries:
+# (cell, register, rank) triples, again only the non-zero registers, with
+# 2**HLL_PRECISION registers per group and merges by element-wise max.
+
+EXACT_DISTINCT_PAIRS = 2_000_000
+
+
+def _bit_length(values):
+    values = values.copy()
+    length = np.zeros(values.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        wide = values >= (np.uint64(1) << np.uint64(shift))
+        length[wide] += shift
+        values[wide] >>= np.uint64(shift)
+    return length + (values > 0)
+
+
+def hll_positions(hashes, precision=HLL_PRECISION):
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    tail   = 64 - precision
+    bucket = (hashes >> np.uint64(tail)).astype(np.int64)
+    rest   = hashes & np.uint64((1 << tail) - 1)
+    rank   = (tail - _bit_length(rest) + 1).astype(np.uint8)
+    return bucket, rank
+
+
+def hll_estimate(registers):
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.exp2(-registers.astype('float64')), axis=1)
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    # small-range correction: linear counting
+    small = (estimate <= 2.5 * m) & (zeros > 0)
+    estimate[small] = m * np.log(m / zeros[small])
+    return estimate
+
+
+def exact_entries(cells, hashes):
+    entries = pd.DataFrame({'cell': cells.astype(np.int32), 'hash': hashes})
+    return entries.drop_duplicates(ignore_index=True)
+
+
+def hll_entries(entries, precision=HLL_PRECISION):
+    # Exact pairs, or HLL entries already, as HLL entries
+    if 'hash' not in entries:
+        return entries
+    bucket, rank = hll_positions(entries['hash'].to_numpy(), precision)
+    entries = pd.DataFrame({'cell': entries['cell'].to_numpy(), 'bucket': bucket.astype(np.int16), 'rank': rank})
+    return merge_hll_entries(entries)
+
+
+def merge_hll_entries(entries):
+    return (entries.groupby(['cell', 'bucket'], sort=False)['rank'].max()
+                   .reset_index())
+
+
+# ==========================================================
+#                        Data cube
+# ==========================================================
+# One cell per (country, city, price type, cuisine, rating bucket) with the
+# row count, the sums the charts need and the restaurant sketch entries.
+# Rating buckets are RATING_STEP wide, which is the slider step, so any
+# slider range selects whole buckets. Charts are answered by rolling up the
+# cells of the current selection instead of scanning the rows.
+
+def cell_keys(df):
+    # The cube dimensions of every row of df
+    return pd.DataFrame({
+        'country_id':    df['country_id'].to_numpy(),
+        'city':          df['city'].to_numpy(),
+        'price_type':    df['price_type'].to_numpy(),
+        'cuisines':      df['cuisines'].to_numpy(),
+        'rating_bucket': np.round(df['aggregate_rating'].to_numpy(dtype='float64') / RATING_STEP).astype(np.int16),
+    })
+
+
+def _compact_cells(cells):
+    # The dimension values repeat across cells: stored as categoricals
+    return cells.astype({column: 'category' for column in DIMENSIONS if column != 'rating_bucket'})
+
+
+def _plain_index(result):
+    # Roll-ups are indexed by plain values, as a groupby of the rows would be
+    names = list(result.index.names)
+    return uncategorize(result.reset_index()).set_index(names)
+
+
+class DataCube:
+    def __init__(self, df, precision=HLL_PRECISION, max_exact_pairs=EXACT_DISTINCT_PAIRS):
+        self.precision       = precision
+        self.max_exact_pairs = max_exact_pairs
+        rows = cell_keys(df).assign(
+            votes=df['votes'].to_numpy(dtype='int64'),
+            rating_sum=df['aggregate_rating'].to_numpy(dtype='float64'),
+            usd_sum=df['average_cost_for_two_USD'].to_numpy(dtype='float64'),
+        )
+        grouped = rows.groupby(DIMENSIONS, observed=True, sort=True)
+        cell_id = grouped.ngroup().to_numpy()
+        cells = grouped.agg(n_rows=('votes', 'size'),
+                            votes=('votes', 'sum'),
+                            rating_sum=('rating_sum', 'sum'),
+                            usd_sum=('usd_sum', 'sum'),
+                            usd_count=('usd_sum', 'count'))
+        self.cells = _compact_cells(cells.reset_index())
+
+        hashes = pd.util.hash_array(df['restaurant_id'].astype(str).to_numpy())
+        self._set_entries(exact_entries(cell_id, hashes))
+        # Aggregation passes over the cells, for instrumentation
+        self.passes = 0
+
+    @property
+    def exact(self):
+        return 'hash' in self.entries
+
+    def _set_entries(self, entries):
+        if 'hash' in entries and len(entries) > self.max_exact_pairs:
+            entries = hll_entries(entries, self.precision)
+        self.entries = entries
+
+    def _combine_entries(self, parts):
+        # parts: entry frames whose cells are already renumbered
+        if all('hash' in part for part in parts):
+            return pd.concat(parts, ignore_index=True).drop_duplicates(ignore_index=True)
+        return merge_hll_entries(pd.concat([hll_entries(part, self.precision) for part in parts],
+                                           ignore_index=True))
+
+    @staticmethod
+    def _renumbered(entries, new_cell):
+        entries = entries.copy()
+        entries['cell'] = new_cell[entries['cell'].to_numpy()].astype(np.int32)
+        return entries[entries['cell'] >= 0]
+
+    def merge(self, other):
+        # Fold another cube (e.g. of the next chunk of rows) into this one:
+        # matching cells add their measures and their sketch entries.
+        cells = pd.concat([uncategorize(self.cells), uncategorize(other.cells)], ignore_index=True)
+        grouped = cells.groupby(DIMENSIONS, observed=True, sort=True)
+        cell_id = grouped.ngroup().to_numpy()
+        n_self  = len(self.cells)
+        entries = self._combine_entries([self._renumbered(self.entries, cell_id[:n_self]),
+                                         self._renumbered(other.entries, cell_id[n_self:])])
+        self.cells = _compact_cells(grouped[['n_rows', 'votes', 'rating_sum', 'usd_sum', 'usd_count']]
+                                    .sum().reset_index())
+        self._set_entries(entries)
+        return self
+
+    def patched(self, df, keys):
+        # A copy of the cube with the cells listed in keys (a frame of
+        # DIMENSIONS values) recomputed from df, the updated table; every
+        # other cell is reused. Removed rows cannot be subtracted from HLL
+        # entries, hence the recomputation rather than a merge.
+        keys  = pd.MultiIndex.from_frame(keys.drop_duplicates())
+        stale = pd.MultiIndex.from_frame(uncategorize(self.cells[DIMENSIONS])).isin(keys)
+        fresh = DataCube(df[pd.MultiIndex.from_frame(cell_keys(df)).isin(keys)], self.precision,
+                         self.max_exact_pairs)
+        cells = pd.concat([uncategorize(self.cells[~stale]), uncategorize(fresh.cells)], ignore_index=True)
+        order = cells.sort_values(DIMENSIONS, kind='stable').index.to_numpy()
+        # Position of every concatenated cell once sorted
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        n_kept   = int((~stale).sum())
+        old_cell = np.full(len(self.cells), -1, dtype=np.int64)
+        old_cell[~stale] = position[:n_kept]
+
+        cube = copy.copy(self)
+        cube.cells  = _compact_cells(cells.iloc[order].reset_index(drop=True))
+        cube._set_entries(self._combine_entries([self._renumbered(self.entries, old_cell),
+                                                 self._renumbered(fresh.entries, position[n_kept:])]))
+        cube.passes = 0
+        return cube
+
+    def nbytes(self):
+        return int(self.cells.memory_usage(deep=True).sum() + self.entries.memory_usage(deep=True).sum())
+
+    def select(self, countries=None, price_types=None, rating_range=None):
+        selection = np.ones(len(self.cells), dtype=bool)
+        if countries is not None:
+            selection &= self.cells['country_id'].isin(list(countries)).to_numpy()
+        if price_types is not None:
+            selection &= self.cells['price_type'].isin(list(price_types)).to_numpy()
+        if rating_range is not None:
+            # Same float32 comparison as the row filters, on the bucket values
+            rating = (self.cells['rating_bucket'].to_numpy() * RATING_STEP).astype(np.float32)
+            low, high = np.float32(rating_range[0]), np.float32(rating_range[1])
+            selection &= (rating >= low) & (rating <= high)
+        return selection
+
+    def _distinct_restaurants(self, grouped, selection):
+        # grouped: the selected cells grouped by the roll-up dimensions
+        group = np.full(len(self.cells), -1, dtype=np.int64)
+        group[selection] = grouped.ngroup().to_numpy()
+        index = grouped.size().index
+        entry_group = group[self.entries['cell'].to_numpy()]
+        inside = entry_group >= 0
+        if self.exact:
+            pairs = pd.DataFrame({'group': entry_group[inside],
+                                  'hash': self.entries['hash'].to_numpy()[inside]}).drop_duplicates()
+            counts = np.bincount(pairs['group'].to_numpy(), minlength=len(index))
+        else:
+            registers = np.zeros((len(index), 1 << self.precision), dtype=np.uint8)
+            np.maximum.at(registers, (entry_group[inside], self.entries['bucket'].to_numpy()[inside]),
+                          self.entries['rank'].to_numpy()[inside])
+            counts = np.round(hll_estimate(registers)).astype(np.int64) if len(index) else np.zeros(0, np.int64)
+        return pd.Series(counts, index=index)
+
+    def distinct_restaurants(self, by, selection):
+        grouped = self.cells.loc[selection].groupby(by, observed=True, sort=True)
+        return self._distinct_restaurants(grouped, selection)
+
+    def aggregate(self, by, column, op, selection=None):
+        # Same result shape as df[by + [column]].groupby(by).agg(op)
+        if selection is None:
+            selection = np.ones(len(self.cells), dtype=bool)
+        self.passes += 1
+        cells   = self.cells.loc[selection]
+        grouped = cells.groupby(by, observed=True, sort=True)
+        if op == 'count':
+            result = grouped['n_rows'].sum()
+        elif op == 'nunique' and column == 'restaurant_id':
+            result = self._distinct_restaurants(grouped, selection)
+        elif op == 'nunique':
+            result = grouped[column].nunique()
+        elif (column, op) == ('votes', 'sum'):
+            result = grouped['votes'].sum()
+        elif (column, op) == ('aggregate_rating', 'sum'):
+            result = grouped['rating_sum'].sum()
+        elif (column, op) == ('aggregate_rating', 'mean'):
+            result = grouped['rating_sum'].sum() / grouped['n_rows'].sum()
+        elif (column, op) == ('average_cost_for_two_USD', 'mean'):
+            result = grouped['usd_sum'].sum() / grouped['usd_count'].sum()
+        else:
+            raise ValueError('The data cube cannot answer {}({})'.format(op, column))
+        result = result.sort_index()
+        return _plain_index(result.to_frame(column))
+
+    def metrics(self, by, selection=None):
+        # Every per-group metric of the Countries page in a single pass over
+        # the selected cells, instead of one groupby per chart.
+        if selection is None:
+            selection = np.ones(len(self.cells), dtype=bool)
+        self.passes += 1
+        grouped = self.cells.loc[selection].groupby(by, observed=True, sort=True)
+        table = grouped.agg(n_rows=('n_rows', 'sum'),
+                            n_cities=('city', 'nunique'),
+                            n_cuisines=('cuisines', 'nunique'),
+                            votes=('votes', 'sum'),
+                            rating_sum=('rating_sum', 'sum'))
+        table['n_restaurant'] = self._distinct_restaurants(grouped, selection)
+        table['votes_per_restaurant']  = table['votes'] / table['n_restaurant']
+        table['rating_per_restaurant'] = table['rating_sum'] / table['n_restaurant']
+        return _plain_index(table.sort_index())
+
+
+_cubes      = {}
+_cubes_lock = threading.Lock()
+
+
+# The current dataset version and the one before it, so sessions still
+# drawing the old table during a refresh do not evict the new cube
+MAX_CUBE_VERSIONS = 2
+
+
+def _store(version, cube):
+    _cubes.pop(version, None)
+    while len(_cubes) >= MAX_CUBE_VERSIONS:
+        _cubes.pop(next(iter(_cubes)))
+    _cubes[version] = cube
+
+
+def data_cube(df, version):
+    with _cubes_lock:
+        cube = _cubes.get(version)
+        if cube is None:
+            cube = DataCube(df)
+            _store(version, cube)
+        return cube
+
+
+def cached_data_cube(version):
+    with _cubes_lock:
+        return _cubes.get(version)
+
+
+def store_data_cube(version, cube):
+    # For cubes built elsewhere: chunk by chunk by dishy.ingest, or patched
+    # by dishy.refresh
+    with _cubes_lock:
+        _store(version, cube)
+
+
+def cube_selection(df, state):
+    # With the filter state dishy.filters.apply_filters returned for df,
+    # the cube of the full table is rolled up over the selected cells; any
+    # other frame (state None) gets a throwaway cube of its own rows.
+    if state is None:
+        return DataCube(df), None
+    from dishy.data import load_dataset
+    version, (countries, price_types, rating_range) = state
+    cube = cached_data_cube(version)
+    if cube is None:
+        table = load_dataset()
+        if table.attrs.get('version') != version:
+            # The table was refreshed while this frame was being drawn
+            return DataCube(df), None
+        cube = data_cube(table, version)
+    return cube, cube.select(countries, price_types, rating_range)
+
+
+def cube_aggregate(df, state, by, column, op):
+    cube, selection = cube_selection(df, state)
+    return cube.aggregate(by, column, op, selection)
+
+
+def cube_metrics(df, state, by):
+    cube, selection = cube_selection(df, state)
+    return cube.metrics(by, selection)
@@ -0,0 +1,187 @@
+# ========================================
+# Import libraries
+# ========================================
+import hashlib
+import os
+import threading
+
+import numpy          as np
+import pandas         as pd
+
+from dishy.cleaning   import clean_code, convert_to_usd, currency_mapping
+from dishy.trace      import stage
+
+
+DATASET_PATH = 'dataset/zomato.csv'
+
+# Read the prebuilt clean snapshot (python -m dishy.snapshot build) when it
+# is present and up to date; DISHY_SNAPSHOT=0 always cleans the CSV.
+USE_SNAPSHOT = os.environ.get('DISHY_SNAPSHOT', '1') != '0'
+# Clean the CSV in chunks of this many rows (dishy.ingest); 0 reads it whole.
+INGEST_CHUNK_SIZE = int(os.environ.get('DISHY_INGEST_CHUNK_SIZE', '0'))
+# Processes cleaning the CSV in parallel (dishy.parallel); 1 cleans in-process.
+WORKERS = int(os.environ.get('DISHY_WORKERS', '1'))
+# Apply a new export of the CSV as a delta in the background (dishy.refresh)
+# instead of re-cleaning it while the sessions wait; DISHY_INCREMENTAL=0
+# always reloads.
+INCREMENTAL = os.environ.get('DISHY_INCREMENTAL', '1') != '0'
+
+
+# ==========================================================
+#                   Process-wide cache
+# ==========================================================
+# Streamlit re-executes the page scripts on every widget change, but
+# imported modules stay alive for the whole process. The clean table is
+# therefore kept here, keyed on the file mtime and its content hash, and
+# every page receives a read-only view of the same frame.
+#
+# The costs in US$ also depend on the exchange rates: the dataset version
+# is the content hash plus the version of the rates the table was
+# converted at, and when a background refresh brings new rates the cached
+# table gets its average_cost_for_two_USD converted again (the rows stay).
+
+_cache = {}
+_lock  = threading.Lock()
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def freeze(df):
+    # Mark the arrays backing the cached frame as read-only, so an in-place
+    # write from any page raises instead of leaking into other sessions.
+    # Every block of the frame is frozen, not only what df[column] returns:
+    # after dishy.schema.compact each downcast column sits in a block of its
+    # own, which a column lookup may not lead back to.
+    for block in df._mgr.blocks:
+        values = block.values
+        if isinstance(values, pd.Categorical):
+            values = values._ndarray
+        while isinstance(values, np.ndarray):
+            values.flags.writeable = False
+            values = values.base
+    return df
+
+
+def read_only_view(df, version=None):
+    # Shallow copy: the pages may add or drop columns without touching the
+    # cached frame, while the shared arrays refuse in-place writes. The view
+    # records the dataset version it belongs to, so indexes and aggregates
+    # built from it stay consistent even if a refresh swaps the table.
+    view = df.copy(deep=False)
+    view.attrs['version'] = version
+    return view
+
+
+def with_rates(df, rates):
+    # The table with its costs converted at rates; the other columns are
+    # shared with df
+    df = df.copy(deep=False)
+    with stage('fx_convert', rows_in=len(df)):
+        convert_to_usd(df, 'currency', currency_mapping, rates)
+    return df
+
+
+def load_clean(path, content_hash, rates, version):
+    if USE_SNAPSHOT:
+        from dishy.snapshot import load_snapshot
+        with stage('snapshot_read') as span:
+            df = load_snapshot(path, content_hash)
+            span.rows_out = None if df is None else len(df)
+        if df is not None:
+            # Converted at the rates of build time
+            return with_rates(df, rates)
+    if INGEST_CHUNK_SIZE:
+        from dishy.cube   import store_data_cube
+        from dishy.ingest import ingest
+        with stage('ingest') as span:
+            df, cube, stats = ingest(path, INGEST_CHUNK_SIZE, rates)
+            span.rows_in, span.rows_out = stats['rows_read'], len(df)
+        store_data_cube(version, cube)
+        print('Ingested {rows_read} rows in {chunks} chunks ({rows_per_s:,.0f} rows/s)'.format(**stats))
+        return df
+
+    with stage('csv_read') as span:
+        raw = pd.read_csv(path)
+        span.rows_out = len(raw)
+    if WORKERS > 1:
+        from dishy.parallel import clean_parallel
+        with stage('clean_parallel', rows_in=len(raw)) as span:
+            df = clean_parallel(raw, WORKERS, rates=rates)
+            span.rows_out = len(df)
+        return df
+    with stage('clean_code', rows_in=len(raw)) as span:
+        df = clean_code(raw, rates=rates)
+        span.rows_out = len(df)
+    return df
+
+
+def dataset_version_for(content_hash, rates_version):
+    return '{}-{}'.format(content_hash, rates_version)
+
+
+def load_dataset(path=DATASET_PATH):
+    from dishy.fx import get_rates_with_version
+    path  = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    rates, rates_version = get_rates_with_version()
+
+    with _lock:
+        entry = _cache.get(path)
+        if entry is not None and (entry['mtime'] == mtime or entry.get('refreshing')):
+            if entry['rates'] != rates_version and not entry.get('refreshing'):
+                # New exchange rates: same rows, costs converted again.
+                # Updated in place, so background threads holding the
+                # entry keep seeing the cached one.
+                entry.update(df=freeze(with_rates(entry['df'], rates)), rates=rates_version,
+                             version=dataset_version_for(entry['hash'], rates_version))
+            return read_only_view(entry['df'], entry['version'])
+
+        # The mtime changed (or first load): only re-clean when the
+        # content did change as well.
+        content_hash = file_hash(path)
+        if entry is not None and entry['hash'] != content_hash and entry.get('rows') is not None:
+            # Sessions keep the current version until the delta is applied
+            from dishy.refresh import refresh_async
+            entry['refreshing'] = True
+            refresh_async(path, entry)
+            return read_only_view(entry['df'], entry['version'])
+        if entry is None or entry['hash'] != content_hash:
+            version = dataset_version_for(content_hash, rates_version)
+            df = freeze(load_clean(path, content_hash, rates, version))
+            entry = {'hash': content_hash, 'rates': rates_version, 'version': version, 'df': df}
+            if INCREMENTAL:
+                from dishy.refresh import index_rows_async
+                index_rows_async(path, entry)
+        entry['mtime'] = mtime
+        _cache[path]   = entry
+        return read_only_view(entry['df'], entry['version'])
+
+
+def swap_entry(path, old_entry, new_entry):
+    # Installs the refreshed table in one assignment; on failure (new_entry
+    # is None) the next load_dataset falls back to a full reload.
+    with _lock:
+        if _cache.get(path) is not old_entry:
+            return
+        if new_entry is None:
+            old_entry.update(refreshing=False, rows=None, mtime=None)
+        else:
+            _cache[path] = new_entry
+
+
+def dataset_version(path=DATASET_PATH):
+    entry = _cache.get(os.path.abspath(path))
+    if entry is None:
+        return None
+    return entry['version']
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
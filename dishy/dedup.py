@@ -0,0 +1,55 @@
+# ========================================
+# Import libraries
+# ========================================
+import numpy          as np
+import pandas         as pd
+
+
+# ==========================================================
+#                   Row fingerprints
+# ==========================================================
+# Exact duplicate rows are found through a uint64 fingerprint of each row
+# (pandas' column hashes, combined) rather than DataFrame.drop_duplicates.
+# Two rows can only be duplicates if their restaurant_id is equal, so only
+# the rows of repeated restaurant_ids are fingerprinted at all; the long
+# name and address strings of every other row are never hashed.
+
+def row_fingerprints(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def drop_duplicate_rows(df, key='restaurant_id'):
+    # Same rows as df.drop_duplicates(), plus the number of rows dropped
+    if key is None or key not in df.columns:
+        candidates = np.ones(len(df), dtype=bool)
+    else:
+        candidates = df[key].duplicated(keep=False).to_numpy()
+    keep = np.ones(len(df), dtype=bool)
+    if candidates.any():
+        fingerprints = row_fingerprints(df[candidates])
+        keep[candidates] = ~pd.Series(fingerprints).duplicated().to_numpy()
+    n_dropped = len(df) - int(keep.sum())
+    return (df[keep] if n_dropped else df), n_dropped
+
+
+# ==========================================================
+#                  Streaming deduplication
+# ==========================================================
+
+class SeenRows:
+    # Fingerprints of the rows kept so far, sorted, so a chunk of rows is
+    # deduplicated against the earlier chunks with a binary search.
+    def __init__(self):
+        self.hashes  = np.zeros(0, dtype=np.uint64)
+        self.dropped = 0
+
+    def drop_duplicates(self, df):
+        hashes = row_fingerprints(df)
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        if len(self.hashes):
+            at = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+            keep &= self.hashes[at] != hashes
+        # Two sorted runs: the stable sort merges them in linear time
+        self.hashes = np.sort(np.concatenate([self.hashes, np.sort(hashes[keep])]), kind='stable')
+        self.dropped += len(df) - int(keep.sum())
+        return df[keep]
@@ -0,0 +1,236 @@
+# ========================================
+# Import libraries
+# ========================================
+import glob
+import hashlib
+import os
+import threading
+import types
+
+from importlib        import metadata
+
+from collections      import OrderedDict
+
+import pandas         as pd
+
+from dishy.lazy       import lazy_import
+from dishy.trace      import stage
+
+
+pio = lazy_import('plotly.io')
+
+FIGURE_CACHE_BYTES = 64 * 1024 * 1024
+# DISHY_FIGURE_CACHE_DIR keeps the figures on disk as well, shared by every
+# worker process pointed at the same directory; the files are evicted
+# oldest-used first above DISHY_FIGURE_CACHE_DISK_BYTES.
+FIGURE_CACHE_DIR        = os.environ.get('DISHY_FIGURE_CACHE_DIR')
+FIGURE_CACHE_DISK_BYTES = int(os.environ.get('DISHY_FIGURE_CACHE_DISK_BYTES', str(256 * 1024 * 1024)))
+# Bump to drop every cached figure, e.g. when the JSON they are stored as
+# changes in a way the code hashes below do not see
+FIGURE_CACHE_VERSION    = 1
+
+
+# ==========================================================
+#                      Figure cache
+# ==========================================================
+# A chart is fully determined by its type, the data it is drawn from and
+# its styling arguments, so its serialised Plotly JSON is cached under
+#   sha1(chart name, builder code, data fingerprint, style)
+# and an unchanged chart is decoded from the cache on rerun instead of
+# being built by Plotly Express again. The builder's bytecode is part of
+# the key, so editing a chart function never serves its old figures. The
+# key is also namespaced by FIGURE_CACHE_VERSION, the plotly version, the
+# dishy sources and the source file of the builder: helpers the builder
+# calls (dishy.scatter, page functions) and library upgrades change the
+# key too, which matters for the disk cache shared across processes.
+#
+# The data fingerprint of a frame from dishy.filters.apply_filters is the
+# filter state returned with it (dataset version + selection); any other
+# frame, such as a cached aggregate, is hashed row by row.
+
+def data_fingerprint(data, state=None):
+    digest = hashlib.sha1()
+    if state is not None:
+        digest.update(repr(state).encode('utf-8'))
+    else:
+        digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    digest.update(repr([(column, str(dtype)) for column, dtype in data.dtypes.items()]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _update_with_code(digest, code):
+    # Bytecode, names and constants (nested functions included); marshal
+    # is not used as its output depends on reference counts
+    digest.update(code.co_code)
+    digest.update(repr((code.co_names, code.co_varnames, code.co_freevars)).encode('utf-8'))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _update_with_code(digest, const)
+        else:
+            digest.update(repr(const).encode('utf-8'))
+
+
+def _source_digest(paths):
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        try:
+            with open(path, 'rb') as f:
+                digest.update(path.encode('utf-8'))
+                digest.update(f.read())
+        except OSError:
+            continue
+    return digest.hexdigest()
+
+
+_namespaces     = {}
+_namespace_lock = threading.Lock()
+
+
+def cache_namespace(source_file):
+    # Computed once per builder source file and process
+    with _namespace_lock:
+        namespace = _namespaces.get(source_file)
+        if namespace is None:
+            dishy_sources = glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))
+            try:
+                plotly_version = metadata.version('plotly')
+            except metadata.PackageNotFoundError:
+                plotly_version = None
+            namespace = hashlib.sha1(repr((FIGURE_CACHE_VERSION, plotly_version, _source_digest(dishy_sources),
+                                           _source_digest([source_file]))).encode('utf-8')).hexdigest()
+            _namespaces[source_file] = namespace
+        return namespace
+
+
+def figure_key(name, build, data, style, state=None):
+    digest = hashlib.sha1()
+    digest.update(cache_namespace(build.__code__.co_filename).encode('utf-8'))
+    digest.update(repr(name).encode('utf-8'))
+    _update_with_code(digest, build.__code__)
+    digest.update(data_fingerprint(data, state).encode('utf-8'))
+    digest.update(repr(sorted(style.items())).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FigureCache:
+    def __init__(self, max_bytes=FIGURE_CACHE_BYTES, directory=None, max_disk_bytes=FIGURE_CACHE_DISK_BYTES):
+        self.max_bytes      = max_bytes
+        self.directory      = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.n_bytes        = 0
+        self.hits           = 0
+        self.disk_hits      = 0
+        self.misses         = 0
+        self.evictions      = 0
+        self._entries       = OrderedDict()
+        self._lock          = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    # ----------------- memory -----------------
+
+    def _put(self, key, spec):
+        size = len(spec.encode('utf-8'))
+        if size > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = (spec, size)
+        self.n_bytes += size
+        while self.n_bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.n_bytes   -= evicted
+            self.evictions += 1
+
+    # ------------------ disk ------------------
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                spec = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            return None
+        return spec
+
+    def _write(self, key, spec):
+        # Written under a unique name and renamed, so another worker never
+        # reads a partial file
+        tmp_path = '{}.{}.{}.tmp'.format(self._path(key), os.getpid(), threading.get_ident())
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(spec)
+            os.replace(tmp_path, self._path(key))
+        except OSError as error:
+            print('Error saving figure cache entry:', error)
+            return
+        self._prune()
+
+    def _prune(self):
+        try:
+            files = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+            stats = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in files]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in sorted(stats):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    # ----------------- lookup -----------------
+
+    def spec(self, key, build):
+        # The figure JSON for key, from memory, disk or build()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0], None
+        spec = self._read(key) if self.directory else None
+        if spec is not None:
+            with self._lock:
+                self.disk_hits += 1
+                self._put(key, spec)
+            return spec, None
+
+        with self._lock:
+            self.misses += 1
+        figure = build()
+        spec   = pio.to_json(figure, validate=False)
+        with self._lock:
+            self._put(key, spec)
+        if self.directory:
+            self._write(key, spec)
+        return spec, figure
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.n_bytes, 'hits': self.hits,
+                    'disk_hits': self.disk_hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+figure_cache = FigureCache(directory=FIGURE_CACHE_DIR)
+
+
+def cached_figure(name, data, build, state=None, **style):
+    # build() draws the chart from data with the given style arguments;
+    # they only enter the key here, so pass every argument the chart uses.
+    # state: the filter state of data when it comes from apply_filters.
+    key = figure_key(name, build, data, style, state)
+    with stage('figure:' + name) as span:
+        spec, figure = figure_cache.spec(key, build)
+        span.rows_in = len(data)
+        if figure is None:
+            figure = pio.from_json(spec)
+    return figure
@@ -0,0 +1,255 @@
+# ========================================
+# Import libraries
+# ========================================
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy          as np
+import pandas         as pd
+import requests
+
+from http.server      import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dishy.trace      import stage
+
+
+RATES_URL      = 'https://api.exchangerate-api.com/v4/latest/USD'
+SNAPSHOT_PATH  = 'dataset/usd_rates.json'
+# Rates fetched at runtime go here (gitignored); the bundled snapshot above
+# is only read.
+CACHE_PATH     = os.environ.get('DISHY_FX_CACHE_PATH', 'dataset/usd_rates.cache.json')
+RATES_TTL      = 6 * 60 * 60
+
+
+# ==========================================================
+#                      Rate providers
+# ==========================================================
+# A provider only has to expose fetch() -> {currency: units per USD}.
+# The pages never call a provider directly: they read the in-memory
+# RateCache below, which answers from memory or from the on-disk snapshot
+# and refreshes from the network in a background thread once it is stale.
+
+class SnapshotRateProvider:
+    def __init__(self, path=SNAPSHOT_PATH, cache_path=CACHE_PATH):
+        self.path       = path
+        self.cache_path = cache_path
+        self.fetched_at = None
+
+    def fetch(self):
+        # The last fetched rates when saved, else the bundled snapshot
+        for path in (self.cache_path, self.path):
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    snapshot = json.load(f)
+                rates = snapshot['rates']
+            except (OSError, ValueError, KeyError) as error:
+                print('Error reading exchange rates from {}:'.format(path), error)
+                continue
+            self.fetched_at = snapshot.get('fetched_at')
+            return rates
+        raise FileNotFoundError('No exchange rates snapshot at {}'.format(self.path))
+
+    def save(self, rates):
+        if not self.cache_path:
+            return
+        snapshot = {'base': 'USD', 'fetched_at': int(time.time()), 'rates': rates}
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.cache_path)
+
+
+class HttpRateProvider:
+    def __init__(self, url=RATES_URL, timeout=5):
+        self.url     = url
+        self.timeout = timeout
+
+    def fetch(self):
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['rates']
+
+
+class StaticRateProvider:
+    def __init__(self, rates):
+        self.rates = dict(rates)
+
+    def fetch(self):
+        return dict(self.rates)
+
+
+# ==========================================================
+#                       TTL cache
+# ==========================================================
+# The cache also reports a version of the rates it serves (a digest of
+# their values), so tables converted with older rates can tell they are
+# out of date once a refresh brings new ones.
+
+def rates_digest(rates):
+    return hashlib.sha1(json.dumps(rates, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+class RateCache:
+    def __init__(self, remote=None, snapshot=None, ttl=RATES_TTL):
+        self.remote      = remote
+        self.snapshot    = snapshot
+        self.ttl         = ttl
+        self._rates      = None
+        self._version    = None
+        self._loaded_at  = 0.0
+        self._lock       = threading.Lock()
+        self._refreshing = threading.Event()
+
+    def rates(self):
+        return self.rates_with_version()[0]
+
+    def rates_with_version(self):
+        # Never waits on the network: memory first, then the local snapshot.
+        with self._lock:
+            if self._rates is None and self.snapshot is not None:
+                self._set(self.snapshot.fetch())
+                # An old snapshot is served right away but also triggers a
+                # background refresh.
+                self._loaded_at = getattr(self.snapshot, 'fetched_at', None) or time.time()
+            rates, version = self._rates, self._version
+            stale = time.time() - self._loaded_at > self.ttl
+        if stale:
+            self.refresh_async()
+        if rates is None:
+            raise LookupError('No exchange rates available: missing snapshot and no refresh done yet')
+        return dict(rates), version
+
+    def _set(self, rates):
+        self._rates   = dict(rates)
+        self._version = rates_digest(self._rates)
+
+    def refresh(self):
+        if self.remote is None:
+            return False
+        try:
+            with stage('fx_fetch'):
+                rates = self.remote.fetch()
+        except Exception as error:
+            print('Error refreshing exchange rates:', error)
+            return False
+        with self._lock:
+            self._set(rates)
+            self._loaded_at = time.time()
+        if self.snapshot is not None and hasattr(self.snapshot, 'save'):
+            try:
+                self.snapshot.save(rates)
+            except OSError as error:
+                print('Error saving exchange rates cache:', error)
+        return True
+
+    def refresh_async(self):
+        if self.remote is None or self._refreshing.is_set():
+            return
+        self._refreshing.set()
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing.clear()
+
+        threading.Thread(target=run, name='fx-refresh', daemon=True).start()
+
+
+def default_rate_cache():
+    # DISHY_FX_OFFLINE=1 keeps the app on the bundled snapshot only,
+    # DISHY_FX_URL points the refreshes to another endpoint (e.g. the stub).
+    remote = None
+    if os.environ.get('DISHY_FX_OFFLINE', '0') != '1':
+        remote = HttpRateProvider(os.environ.get('DISHY_FX_URL', RATES_URL))
+    return RateCache(remote=remote, snapshot=SnapshotRateProvider())
+
+
+_rate_cache      = None
+_rate_cache_lock = threading.Lock()
+
+
+def get_rate_cache():
+    global _rate_cache
+    with _rate_cache_lock:
+        if _rate_cache is None:
+            _rate_cache = default_rate_cache()
+        return _rate_cache
+
+
+def set_rate_cache(cache):
+    global _rate_cache
+    with _rate_cache_lock:
+        _rate_cache = cache
+
+
+def get_rates():
+    with stage('fx_rates'):
+        return get_rate_cache().rates()
+
+
+def get_rates_with_version():
+    with stage('fx_rates'):
+        return get_rate_cache().rates_with_version()
+
+
+# ==========================================================
+#                  Local stub server (tests)
+# ==========================================================
+# Serves the same JSON shape as exchangerate-api.com on localhost, so the
+# HTTP provider and the cache refreshes can be exercised without network
+# access:
+#
+#   server, url = serve_stub_rates({'USD': 1.0, 'INR': 83.0})
+#   cache = RateCache(remote=HttpRateProvider(url))
+#   ...
+#   server.shutdown()
+
+def serve_stub_rates(rates, host='127.0.0.1', port=0):
+    payload = json.dumps({'base': 'USD', 'rates': rates}).encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='fx-stub', daemon=True).start()
+    url = 'http://{}:{}/v4/latest/USD'.format(*server.server_address)
+    return server, url
+
+
+# ==========================================================
+#                  Vectorized conversion
+# ==========================================================
+
+def usd_rates_for(currencies, currency_mapping, rates=None):
+    # One lookup per distinct currency label instead of one per row: the
+    # labels are factorized and the rates gathered with a single take.
+    if rates is None:
+        rates = get_rates()
+    codes, labels = pd.factorize(currencies, sort=False)
+    label_rates = np.array([rates.get(currency_mapping.get(label), np.nan)
+                            for label in labels] + [np.nan], dtype='float64')
+    # factorize marks missing labels with -1, which picks the trailing NaN
+    return label_rates[codes]
+
+
+def to_usd(df, columns, currency_column, currency_mapping, rates=None, suffix='_USD'):
+    if isinstance(columns, str):
+        columns = [columns]
+    row_rates = usd_rates_for(df[currency_column], currency_mapping, rates)
+    for column in columns:
+        df[column + suffix] = df[column].to_numpy(dtype='float64') / row_rates
+    return df
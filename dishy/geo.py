@@ -0,0 +1,175 @@
+# ========================================
+# Import libraries
+# ========================================
+import json
+import os
+import threading
+import time
+
+from collections      import OrderedDict
+
+from dishy.trace      import stage
+
+
+GEOCODE_CACHE_PATH = 'dataset/geocode_cache.json'
+GEOCODE_CACHE_SIZE = 1024
+USER_AGENT         = 'my_app'
+
+
+# ==========================================================
+#                   Bundled centroids
+# ==========================================================
+# Points returned by Nominatim for the countries of COUNTRIES_ISO, so the
+# Countries map renders without a single network call.
+
+COUNTRY_CENTROIDS = {
+    "India":                    (22.3511148,  78.6677428),
+    "Australia":                (-24.7761086, 134.755),
+    "Brazil":                   (-10.3333333, -53.2),
+    "Canada":                   (61.0666922,  -107.991707),
+    "Indonesia":                (-2.4833826,  117.8902853),
+    "New Zealand":              (-41.5000831, 172.8344077),
+    "Philippines":              (12.7503486,  122.7312101),
+    "Qatar":                    (25.3336984,  51.2295295),
+    "Singapore":                (1.357107,    103.8194992),
+    "South Africa":             (-28.8166236, 24.991639),
+    "Sri Lanka":                (7.5554942,   80.7137847),
+    "Turkey":                   (38.9597594,  34.9249653),
+    "United Arab Emirates":     (24.0002488,  53.9994829),
+    "United Kingdom":           (54.7023545,  -3.2765753),
+    "United States of America": (39.7837304,  -100.445882),
+}
+
+
+# ==========================================================
+#                    On-disk LRU cache
+# ==========================================================
+
+class GeocodeCache:
+    def __init__(self, path=GEOCODE_CACHE_PATH, max_entries=GEOCODE_CACHE_SIZE):
+        self.path        = path
+        self.max_entries = max_entries
+        self._entries    = OrderedDict()
+        self._lock       = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for query, point in entries:
+            self._entries[query] = tuple(point) if point is not None else None
+
+    def save(self):
+        with self._lock:
+            entries = [[query, point] for query, point in self._entries.items()]
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as error:
+            print('Error saving geocode cache:', error)
+
+    def __contains__(self, query):
+        with self._lock:
+            return query in self._entries
+
+    def get(self, query):
+        with self._lock:
+            if query not in self._entries:
+                return None
+            self._entries.move_to_end(query)
+            return self._entries[query]
+
+    def put(self, query, point):
+        with self._lock:
+            self._entries[query] = point
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# ==========================================================
+#                     Batch resolver
+# ==========================================================
+
+class Geocoder:
+    # Answers from the bundled centroids and the disk cache only. Queries
+    # that are in neither are geocoded by a background thread (one request
+    # per second, as Nominatim asks) and show up on a later rerun.
+
+    def __init__(self, cache=None, user_agent=USER_AGENT, min_delay=1.0):
+        self.cache      = cache if cache is not None else GeocodeCache()
+        self.user_agent = user_agent
+        self.min_delay  = min_delay
+        self._pending   = []
+        self._lock      = threading.Lock()
+        self._worker    = None
+
+    def resolve(self, query):
+        return self.resolve_many([query])[query]
+
+    def resolve_many(self, queries):
+        points  = {}
+        missing = []
+        for query in queries:
+            if query in COUNTRY_CENTROIDS:
+                points[query] = COUNTRY_CENTROIDS[query]
+            elif query in self.cache:
+                points[query] = self.cache.get(query)
+            else:
+                points[query] = None
+                missing.append(query)
+        if missing:
+            self.enqueue(missing)
+        return points
+
+    def enqueue(self, queries):
+        with self._lock:
+            self._pending.extend(q for q in queries if q not in self._pending)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='geocoder', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        from geopy.geocoders import Nominatim
+        geolocator = Nominatim(user_agent=self.user_agent)
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._worker = None
+                    break
+                query = self._pending.pop(0)
+            try:
+                with stage('geocode_request', rows_in=1):
+                    location = geolocator.geocode(query)
+            except Exception as error:
+                # Not cached: the query is retried the next time it is asked
+                print('Error geocoding {}:'.format(query), error)
+            else:
+                point = None if location is None else (location.latitude, location.longitude)
+                self.cache.put(query, point)
+                self.cache.save()
+            time.sleep(self.min_delay)
+
+
+_geocoder      = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = Geocoder()
+        return _geocoder
+
+
+def resolve_many(queries):
+    with stage('geocode', rows_in=len(queries)) as span:
+        points = get_geocoder().resolve_many(queries)
+        span.rows_out = sum(point is not None for point in points.values())
+    return points
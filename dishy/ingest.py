@@ -0,0 +1,318 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+import os
+import tempfile
+import time
+
+import numpy          as np
+import pandas         as pd
+
+from pandas.api.types import union_categoricals
+
+from dishy.cleaning   import drop_outliers, rename_columns, transform_columns
+from dishy.cube       import DataCube
+from dishy.data       import DATASET_PATH
+from dishy.dedup      import SeenRows
+from dishy.fx         import get_rates
+from dishy.refresh    import RowIndex
+from dishy.schema     import (BOOLEAN_COLUMNS, CATEGORY_MAX_RATIO, FLOAT32_COLUMNS, INTEGER_COLUMNS,
+                              compact)
+
+try:
+    import pyarrow         as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+except ImportError:
+    pa = pc = feather = None
+
+
+CHUNK_SIZE = 100_000
+
+
+# ==========================================================
+#                  Whole-file cleaning steps
+# ==========================================================
+# clean_code needs the whole file for three steps. When the CSV is read in
+# chunks they are carried across chunks instead:
+#   - drop_single_value_columns: the columns that have not shown a second
+#     distinct value yet are tracked and dropped at the end,
+#   - drop_duplicates: every clean row is fingerprinted and checked
+#     against the sorted fingerprints of the rows already kept (SeenRows),
+#   - compact: the chunks are written to Feather files as they come and
+#     copied into the final file at the end, with the dtypes compact would
+#     pick for the whole table (see write_clean_chunks). Without pyarrow,
+#     string columns are held as categoricals per chunk and unioned.
+
+class SingleValueColumns:
+    def __init__(self):
+        self.values = None
+
+    def update(self, raw):
+        if self.values is None:
+            self.values = {column: set() for column in raw.columns}
+        for column in list(self.values):
+            seen = self.values[column]
+            seen.update(raw[column].dropna().unique()[:2])
+            if len(seen) > 1:
+                del self.values[column]
+
+    def columns(self):
+        return [column for column, seen in (self.values or {}).items() if len(seen) == 1]
+
+
+def concat_chunks(chunks, categorical):
+    # Columns are popped from the chunks as they are joined, so each column
+    # is only held twice while it is being concatenated.
+    columns = {}
+    for column in list(chunks[0].columns):
+        parts = [chunk.pop(column) for chunk in chunks]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            values = pd.Series(union_categoricals(parts, sort_categories=True))
+            # Only the columns clean_code makes categorical stay so whatever
+            # their cardinality; compact decides for the others.
+            if column not in categorical and values.nunique() > CATEGORY_MAX_RATIO * len(values):
+                values = values.astype(object)
+        else:
+            values = pd.concat(parts, ignore_index=True)
+        columns[column] = values.reset_index(drop=True)
+    return pd.DataFrame(columns)
+
+
+# ==========================================================
+#                   Streaming ingestion
+# ==========================================================
+
+def clean_chunks(path=DATASET_PATH, chunk_size=CHUNK_SIZE, stats=None, rates=None):
+    # Yields each chunk cleaned and deduplicated against the earlier ones;
+    # the single-value columns and the RowIndex of the export (for
+    # dishy.refresh) are only in stats once the generator is done.
+    stats = stats if stats is not None else {}
+    stats.update(rows_read=0, duplicates=0, outliers=0, rows=0)
+    single_value = stats['single_value'] = SingleValueColumns()
+    seen  = SeenRows()
+    rows  = []
+    rates = get_rates() if rates is None else rates
+    for raw in pd.read_csv(path, chunksize=chunk_size):
+        single_value.update(raw)
+        raw = rename_columns(raw)
+        rows.append(RowIndex(raw))
+        df = transform_columns(raw, rates)
+        df = seen.drop_duplicates(df)
+        stats['duplicates'] = seen.dropped
+        n_rows = len(df)
+        df = drop_outliers(df)
+        stats['outliers']  += n_rows - len(df)
+        stats['rows_read'] += len(raw)
+        stats['rows']      += len(df)
+        yield df
+    stats['row_index'] = RowIndex.concat(rows)
+
+
+def dropped_columns(stats):
+    # The single-value columns of the file, by their clean names
+    return list(rename_columns(pd.DataFrame(columns=stats['single_value'].columns())).columns)
+
+
+# ==========================================================
+#                  Streaming Feather writer
+# ==========================================================
+# Each clean chunk is written to a Feather part file as soon as it is
+# cleaned, so only one chunk is in memory at a time. Once every chunk is
+# known the parts are memory-mapped and copied batch by batch into one
+# Feather file, with the column types compact would give the whole table:
+#   - integer columns downcast over their global range,
+#   - string columns dictionary-encoded against one dictionary: the sorted
+#     union of the parts' (kept as is when every part has the same, as the
+#     fixed categories of clean_code do), for the columns that are
+#     categorical in the chunks or have few enough distinct values.
+
+def _is_text(arrow_type):
+    return (pa.types.is_dictionary(arrow_type) or pa.types.is_string(arrow_type)
+            or pa.types.is_large_string(arrow_type))
+
+
+def _decoded(values):
+    # The plain values of a (possibly dictionary-encoded) chunked array
+    if pa.types.is_dictionary(values.type):
+        return values.cast(values.type.value_type)
+    return values
+
+
+def _smallest_int(low, high):
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return pa.from_numpy_dtype(dtype)
+    return pa.int64()
+
+
+def _dictionary_type(size, value_type, ordered=False):
+    index = pa.int8() if size < 2**7 else pa.int16() if size < 2**15 else pa.int32()
+    return pa.dictionary(index, value_type, ordered)
+
+
+def _distinct_at_most(columns, limit):
+    # Whether the chunked arrays hold at most limit distinct values; only
+    # their hashes are kept, and counting stops past the limit.
+    seen = np.zeros(0, dtype=np.uint64)
+    for values in columns:
+        values = _decoded(values).to_pandas()
+        seen = np.union1d(seen, pd.util.hash_array(values.to_numpy(dtype=object)))
+        if len(seen) > limit:
+            return False
+    return True
+
+
+def _text_target(name, columns, categorical, n_rows):
+    # (arrow type, dictionary or None) of a string column
+    types = [values.type for values in columns if not pa.types.is_null(values.type)]
+    if name not in categorical and not _distinct_at_most(columns, CATEGORY_MAX_RATIO * n_rows):
+        return pa.string(), None
+    dictionaries = [values.chunk(0).dictionary if values.num_chunks else pa.array([], pa.string())
+                    for values in columns if pa.types.is_dictionary(values.type)]
+    ordered = any(arrow_type.ordered for arrow_type in types if pa.types.is_dictionary(arrow_type))
+    if len(dictionaries) == len(types) and all(d.equals(dictionaries[0]) for d in dictionaries):
+        dictionary = dictionaries[0]
+    else:
+        values = pa.chunked_array([pc.unique(_decoded(values)) for values in columns if len(values)]
+                                  or [pa.array([], pa.string())], pa.string())
+        dictionary = pc.unique(values)
+        dictionary = dictionary.filter(pc.is_valid(dictionary))
+        dictionary = dictionary.take(pc.sort_indices(dictionary))
+    return _dictionary_type(len(dictionary), pa.string(), ordered), dictionary
+
+
+def _numeric_target(name, columns):
+    types = [values.type for values in columns if not pa.types.is_null(values.type)]
+    if not types:
+        return pa.null()
+    if name in BOOLEAN_COLUMNS:
+        return pa.bool_()
+    if name in FLOAT32_COLUMNS:
+        return pa.float32()
+    if all(arrow_type == types[0] for arrow_type in types) and not pa.types.is_integer(types[0]):
+        return types[0]
+    if all(pa.types.is_boolean(arrow_type) for arrow_type in types):
+        return pa.bool_()
+    if name in INTEGER_COLUMNS:
+        # Downcast as pd.to_numeric(downcast='integer'): floats too, when
+        # they are all whole numbers
+        values = [values for values in columns if len(values) and not pa.types.is_null(values.type)]
+        whole  = all(values.null_count == 0 for values in values) and all(
+                 pc.all(pc.equal(pc.floor(v.cast(pa.float64())), v.cast(pa.float64()))).as_py() is not False
+                 for v in values if pa.types.is_floating(v.type))
+        if whole and values:
+            ranges = [pc.min_max(v) for v in values]
+            return _smallest_int(min(r['min'].as_py() for r in ranges), max(r['max'].as_py() for r in ranges))
+    if all(pa.types.is_integer(arrow_type) for arrow_type in types):
+        return pa.int64()
+    return pa.float64()
+
+
+def _converted(values, arrow_type, dictionary):
+    if pa.types.is_null(values.type):
+        return pa.nulls(len(values), arrow_type)
+    if dictionary is None:
+        return values.cast(arrow_type)
+    if pa.types.is_dictionary(values.type):
+        values = values.dictionary_decode()
+    indices = pc.index_in(values, value_set=dictionary).cast(arrow_type.index_type)
+    return pa.DictionaryArray.from_arrays(indices, dictionary)
+
+
+def write_clean_chunks(chunks, path, stats, metadata=None):
+    # chunks: clean_chunks(..., stats); writes the table they make up to
+    # the Feather file at path and returns its number of rows. metadata(stats)
+    # gives the schema metadata, once every chunk has been read.
+    if pa is None:
+        raise RuntimeError('pyarrow is required to stream chunks to Feather')
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmp:
+        part_paths = []
+        for df in chunks:
+            part_paths.append(os.path.join(tmp, '{}.feather'.format(len(part_paths))))
+            feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), part_paths[-1],
+                                  compression='uncompressed')
+        if not part_paths:
+            raise ValueError('No rows to write')
+        parts   = [feather.read_table(part, memory_map=True) for part in part_paths]
+        dropped = set(dropped_columns(stats))
+        names   = [name for name in parts[0].column_names if name not in dropped]
+        n_rows  = sum(part.num_rows for part in parts)
+
+        categorical = {name for name in names
+                       if any(pa.types.is_dictionary(part.schema.field(name).type) for part in parts)}
+        targets = {}
+        for name in names:
+            columns = [part.column(name) for part in parts]
+            if any(_is_text(values.type) for values in columns):
+                targets[name] = _text_target(name, columns, categorical, n_rows)
+            else:
+                targets[name] = _numeric_target(name, columns), None
+
+        schema = pa.schema([(name, targets[name][0]) for name in names],
+                           metadata=metadata(stats) if metadata else None)
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+            for part in parts:
+                for batch in part.select(names).to_batches():
+                    writer.write_batch(pa.record_batch(
+                        [_converted(batch.column(i), *targets[name]) for i, name in enumerate(names)],
+                        schema=schema))
+    return n_rows
+
+
+def ingest(path=DATASET_PATH, chunk_size=CHUNK_SIZE, rates=None):
+    # Returns the clean table (same as clean_code(pd.read_csv(path))), its
+    # data cube built chunk by chunk, and the ingestion stats.
+    start  = time.perf_counter()
+    stats  = {}
+    cube   = None
+    n_chunks = 0
+
+    def with_cube(chunks):
+        nonlocal cube, n_chunks
+        for df in chunks:
+            chunk_cube = DataCube(df)
+            cube = chunk_cube if cube is None else cube.merge(chunk_cube)
+            n_chunks += 1
+            yield df
+
+    chunks = with_cube(clean_chunks(path, chunk_size, stats, rates))
+    if pa is not None:
+        with tempfile.TemporaryDirectory() as tmp:
+            clean_path = os.path.join(tmp, 'clean.feather')
+            write_clean_chunks(chunks, clean_path, stats)
+            df = feather.read_table(clean_path, memory_map=True).to_pandas()
+    else:
+        parts, categorical = [], set()
+        for df in chunks:
+            categorical.update(df.select_dtypes('category').columns)
+            parts.append(df.astype({column: 'category' for column in df.select_dtypes('object').columns
+                                    if df[column].nunique() <= CATEGORY_MAX_RATIO * len(df)}))
+        df = compact(concat_chunks(parts, categorical).drop(columns=dropped_columns(stats)))
+    stats.pop('single_value')
+
+    stats['chunks']     = n_chunks
+    stats['seconds']    = time.perf_counter() - start
+    stats['rows_per_s'] = stats['rows_read'] / stats['seconds']
+    return df, cube, stats
+
+
+# ==========================================================
+#                     Command line
+# ==========================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean the zomato CSV in chunks')
+    parser.add_argument('--csv', default=DATASET_PATH)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    df, cube, stats = ingest(args.csv, args.chunk_size)
+    print('{rows_read} rows read in {chunks} chunks, {duplicates} duplicates and '
+          '{outliers} outliers dropped, {rows} rows kept'.format(**stats))
+    print('{:.2f} s, {:,.0f} rows/s, {} cube cells'.format(stats['seconds'], stats['rows_per_s'], len(cube.cells)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+import glob
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+
+from dishy.trace      import stage
+
+
+# DISHY_LAZY_IMPORTS=0 imports every heavy dependency when the page starts,
+# as a plain import statement would.
+LAZY = os.environ.get('DISHY_LAZY_IMPORTS', '1') != '0'
+# Reported by the import-time report when a page loads them at startup
+HEAVY_MODULES = ['folium', 'geopandas', 'geopy', 'plotly.express', 'PIL.Image', 'streamlit_folium']
+PAGE_HEADER_END = '# ----------------- Start of the logical code structure'
+
+
+# ==========================================================
+#                    Deferred imports
+# ==========================================================
+# The pages and dishy.maps bind their heavy dependencies through the
+# proxies below instead of import statements: the module is imported the
+# first time one of its attributes is used, i.e. when the chart or map
+# that needs it is actually drawn. Each import is timed once and traced
+# as an 'import:<module>' stage of the rerun that triggered it.
+#
+#   px            = lazy_import('plotly.express')
+#   folium_static = lazy_function('streamlit_folium', 'folium_static')
+
+_import_times = {}
+_import_lock  = threading.Lock()
+
+
+def _load(name):
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    # Python's own import locks make concurrent first uses safe
+    with stage('import:' + name):
+        start   = time.perf_counter()
+        module  = importlib.import_module(name)
+        seconds = time.perf_counter() - start
+    with _import_lock:
+        _import_times.setdefault(name, seconds)
+    return module
+
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+
+    def _resolve(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = _load(self.__name__)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __dir__(self):
+        return dir(self._resolve())
+
+
+def lazy_import(name):
+    if not LAZY:
+        return _load(name)
+    return LazyModule(name)
+
+
+def lazy_function(module, name):
+    # A function of module, imported on the first call
+    if not LAZY:
+        return getattr(_load(module), name)
+
+    def call(*args, **kwargs):
+        return getattr(_load(module), name)(*args, **kwargs)
+
+    call.__name__ = name
+    return call
+
+
+def import_times():
+    # Seconds spent importing each deferred module in this process
+    with _import_lock:
+        return dict(_import_times)
+
+
+# ==========================================================
+#                  Import-time report
+# ==========================================================
+# Every page header (its imports and functions) is executed in a fresh
+# interpreter, once with deferred imports and once with eager ones, to
+# report the startup cost of the page and which heavy modules it loads.
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+source = open(sys.argv[1], encoding='utf-8').read()
+source = source[:source.index(sys.argv[2])]
+exec(compile(source, sys.argv[1], 'exec'), {'__name__': 'page'})
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'loaded': [m for m in json.loads(sys.argv[3]) if m in sys.modules]}))
+'''
+
+
+def page_paths():
+    return ['Home.py'] + sorted(glob.glob('pages/*.py'))
+
+
+def probe_page(path, lazy=True):
+    env = dict(os.environ, DISHY_LAZY_IMPORTS='1' if lazy else '0', DISHY_TRACE_JSONL='')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.getcwd(), env.get('PYTHONPATH')]))
+    output = subprocess.run([sys.executable, '-c', _PROBE, path, PAGE_HEADER_END, json.dumps(HEAVY_MODULES)],
+                            capture_output=True, text=True, env=env, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_report(paths=None, repeat=3):
+    rows = []
+    for path in paths or page_paths():
+        eager = [probe_page(path, lazy=False) for _ in range(repeat)]
+        lazy  = [probe_page(path, lazy=True) for _ in range(repeat)]
+        rows.append({'page': os.path.basename(path),
+                     'eager_s': min(run['seconds'] for run in eager),
+                     'lazy_s': min(run['seconds'] for run in lazy),
+                     'eager_loaded': eager[0]['loaded'],
+                     'lazy_loaded': lazy[0]['loaded']})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report the import time of every page at startup')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many cold starts')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    rows = import_report(repeat=args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print('{:<22} {:>9} {:>9}  {}'.format('page', 'eager_s', 'lazy_s', 'heavy modules loaded at startup (lazy)'))
+    for row in rows:
+        print('{:<22} {:>9.3f} {:>9.3f}  {}'.format(row['page'], row['eager_s'], row['lazy_s'],
+                                                    ', '.join(row['lazy_loaded']) or '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# ========================================
+# Import libraries
+# ========================================
+import numpy          as np
+import pandas         as pd
+
+from dishy.lazy       import lazy_function, lazy_import
+
+
+# folium is only imported when a map is built
+folium            = lazy_import('folium')
+FastMarkerCluster = lazy_function('folium.plugins', 'FastMarkerCluster')
+HeatMap           = lazy_function('folium.plugins', 'HeatMap')
+
+
+# Above this many restaurants the map stops shipping one marker per row
+# and switches to a server-side aggregated grid drawn as a heatmap, or to
+# the viewport clusters of dishy.tiles when a pyramid is available.
+MAX_MARKERS    = 20_000
+GRID_CELL_SIZE = 0.25
+# Clusters are taken this many zoom levels below the map zoom, i.e. each
+# 256px map tile is split into 8 x 8 clusters.
+CLUSTER_DETAIL = 3
+# Initial view of the viewport-clustered map. folium.Map without a location
+# is forced to zoom 1, so both are given explicitly.
+VIEW_LOCATION  = (20, 0)
+VIEW_ZOOM      = 2
+
+
+# ==========================================================
+#                   Client-side markers
+# ==========================================================
+# The rows are sent once as a compact JSON array and the markers and their
+# popups are built in the browser, instead of one folium.Marker (plus its
+# own popup HTML and JS) per restaurant.
+
+MARKER_CALLBACK = """
+function (row) {
+    var escape = function (text) {
+        return String(text).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+    };
+    var icon = L.AwesomeMarkers.icon({icon: 'home', prefix: 'fa', markerColor: row[6]});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    var html = '<p><strong>' + escape(row[2]) + '</strong></p>'
+             + '<p>Price: US$ ' + row[3] + ' for two'
+             + '<br />Type: ' + escape(row[4])
+             + '<br />Aggragate Rating: ' + row[5] + '/5.0';
+    marker.bindPopup(html, {maxWidth: 500});
+    return marker;
+};
+"""
+
+
+def marker_rows(df):
+    # One list per restaurant, built from whole columns at once
+    columns = [
+        df['latitude'].to_numpy().tolist(),
+        df['longitude'].to_numpy().tolist(),
+        df['restaurant_name'].astype(str).tolist(),
+        df['average_cost_for_two_USD'].round(2).tolist(),
+        df['cuisines'].astype(str).tolist(),
+        df['aggregate_rating'].astype(float).round(1).tolist(),
+        df['rating_color'].astype(str).tolist(),
+    ]
+    return [list(row) for row in zip(*columns)]
+
+
+def marker_cluster_layer(df):
+    return FastMarkerCluster(marker_rows(df), callback=MARKER_CALLBACK)
+
+
+# ==========================================================
+#                  Server-side aggregation
+# ==========================================================
+
+def grid_cells(df, cell_size=GRID_CELL_SIZE):
+    # Count restaurants per lat/lon grid cell; each cell is drawn at the
+    # mean position of its restaurants.
+    row = np.floor(df['latitude'].to_numpy() / cell_size).astype(np.int64)
+    col = np.floor(df['longitude'].to_numpy() / cell_size).astype(np.int64)
+    cells = (pd.DataFrame({'row': row, 'col': col,
+                           'latitude': df['latitude'].to_numpy(),
+                           'longitude': df['longitude'].to_numpy()})
+               .groupby(['row', 'col'], sort=False)
+               .agg(latitude=('latitude', 'mean'),
+                    longitude=('longitude', 'mean'),
+                    n_restaurant=('latitude', 'size'))
+               .reset_index(drop=True)
+             )
+    return cells
+
+
+def grid_heatmap_layer(df, cell_size=GRID_CELL_SIZE):
+    cells = grid_cells(df, cell_size)
+    weights = cells['n_restaurant'] / cells['n_restaurant'].max()
+    data = np.column_stack([cells['latitude'], cells['longitude'], weights]).tolist()
+    return HeatMap(data, radius=15)
+
+
+# ==========================================================
+#                   Viewport clusters
+# ==========================================================
+
+def bounds_from_leaflet(bounds):
+    # st_folium returns Leaflet bounds: {'_southWest': {...}, '_northEast': {...}}
+    if not bounds or bounds.get('_southWest', {}).get('lat') is None:
+        return None
+    south_west, north_east = bounds['_southWest'], bounds['_northEast']
+    return (south_west['lat'], south_west['lng'], north_east['lat'], north_east['lng'])
+
+
+def leaflet_view(output, initial):
+    # The {'zoom', 'bounds'} view of st_folium's output. Before the browser
+    # reports anything, the output only echoes the map options, without
+    # bounds: that is the initial view, not a pan.
+    if not output or output.get('zoom') is None:
+        return initial
+    bounds = bounds_from_leaflet(output.get('bounds'))
+    if bounds is None:
+        return initial
+    return {'zoom': output['zoom'], 'bounds': bounds}
+
+
+def viewport_clusters(pyramid, zoom, bounds=None, mask=None, key=None):
+    return pyramid.clusters(zoom + CLUSTER_DETAIL, bounds, mask, key)
+
+
+def cluster_layer(clusters):
+    layer = folium.FeatureGroup(name='Restaurants')
+    radius = 4 + 3 * np.log10(clusters['n_restaurant'].to_numpy())
+    for lat, lon, n, r in zip(clusters['latitude'], clusters['longitude'],
+                              clusters['n_restaurant'], radius):
+        folium.CircleMarker([lat, lon], radius=float(r), weight=1, fill=True,
+                            fill_opacity=0.6, tooltip='{} restaurants'.format(n)
+                            ).add_to(layer)
+    return layer
+
+
+# ==========================================================
+#                        Map
+# ==========================================================
+
+def restaurant_map(df, max_markers=MAX_MARKERS, cell_size=GRID_CELL_SIZE):
+    f = folium.Figure(width=1920, height=1080)
+    m = folium.Map(max_bounds=True).add_to(f)
+    if len(df) <= max_markers:
+        marker_cluster_layer(df).add_to(m)
+    else:
+        grid_heatmap_layer(df, cell_size).add_to(m)
+    return m
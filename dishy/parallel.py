@@ -0,0 +1,71 @@
+# ========================================
+# Import libraries
+# ========================================
+import multiprocessing
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy          as np
+
+from dishy.cleaning   import drop_outliers, drop_single_value_columns, rename_columns, transform_columns
+from dishy.dedup      import drop_duplicate_rows
+from dishy.fx         import get_rates
+from dishy.ingest     import concat_chunks
+from dishy.schema     import compact
+
+
+# Below this many rows per worker the pool costs more than it saves
+MIN_PARTITION_ROWS = 50_000
+# The columns transform_columns reads; only these are sent to the workers
+TRANSFORM_COLUMNS = ['restaurant_id', 'country_code', 'city', 'cuisines', 'average_cost_for_two',
+                     'currency', 'price_range', 'rating_color']
+
+
+# ==========================================================
+#                  Parallel cleaning
+# ==========================================================
+# The row-wise steps of clean_code (country, price type, colour, cuisine,
+# currency) run on partitions of the raw table in a process pool. The
+# partitions come back in their original order and are joined like the
+# chunks of dishy.ingest, so the result does not depend on which worker
+# finished first; duplicates are then dropped across the whole table.
+# Processes are spawned rather than forked, as the app may already be
+# running threads (rate refresher, geocoder) when it cleans.
+
+def _transform_partition(args):
+    partition, rates = args
+    return transform_columns(partition, rates)
+
+
+def partitions(df, n_partitions):
+    bounds = np.linspace(0, len(df), n_partitions + 1).astype(int)
+    return [df.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def clean_parallel(df, workers=None, stats=None, rates=None):
+    # Same table as clean_code(df)
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(df) // MIN_PARTITION_ROWS))
+    df    = rename_columns(drop_single_value_columns(df))
+    rates = get_rates() if rates is None else rates
+
+    if workers == 1:
+        df = transform_columns(df, rates)
+    else:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            parts = list(pool.map(_transform_partition,
+                                  [(part, rates) for part in partitions(df[TRANSFORM_COLUMNS], workers)]))
+        transformed = concat_chunks(parts, set(parts[0].select_dtypes('category').columns))
+        df = df.reset_index(drop=True)
+        for column in transformed.columns:
+            df[column] = transformed[column]
+
+    df, n_duplicates = drop_duplicate_rows(df)
+    if stats is not None:
+        stats.update(duplicates=n_duplicates, workers=workers)
+    df = drop_outliers(df)
+    df = df.reset_index(drop=True)
+    df = compact(df)
+    return df
@@ -0,0 +1,174 @@
+# ========================================
+# Import libraries
+# ========================================
+import os
+import threading
+import time
+
+import numpy          as np
+import pandas         as pd
+
+from pandas.api.types import is_numeric_dtype, union_categoricals
+
+from dishy.cleaning   import (COLOR_DTYPE, COUNTRY_DTYPE, ISO_DTYPE, PRICE_TYPE_DTYPE,
+                              drop_outliers, rename_columns, transform_columns)
+from dishy.cube       import cached_data_cube, cell_keys, store_data_cube
+from dishy.data       import dataset_version_for, file_hash, freeze, swap_entry, with_rates
+from dishy.dedup      import drop_duplicate_rows
+from dishy.fx         import get_rates_with_version
+from dishy.schema     import compact
+from dishy.snapshot   import read_row_index
+from dishy.trace      import stage
+
+
+# Categories fixed by clean_code, kept even when no row uses them
+FIXED_DTYPES = [COUNTRY_DTYPE, ISO_DTYPE, PRICE_TYPE_DTYPE, COLOR_DTYPE]
+
+
+# ==========================================================
+#                      Row index
+# ==========================================================
+# Every row of the raw export is reduced to two uint64 hashes: its
+# restaurant_id and its whole content. A restaurant whose set of row
+# hashes differs between two exports was appended, changed or removed;
+# only its rows are cleaned again and swapped into the clean table.
+
+def id_hashes(restaurant_id):
+    return pd.util.hash_array(restaurant_id.astype(str).to_numpy(dtype=object))
+
+
+def row_hashes(raw):
+    # Numeric columns are hashed as float64, so a row hashes the same
+    # whether read_csv parsed its column as int or float: the whole file
+    # and each of its chunks (dishy.ingest) give the same hashes.
+    columns = {column: raw[column].astype('float64') if is_numeric_dtype(raw[column]) else raw[column]
+               for column in raw.columns}
+    return pd.util.hash_pandas_object(pd.DataFrame(columns), index=False).to_numpy()
+
+
+class RowIndex:
+    def __init__(self, raw):
+        # raw: the export after rename_columns
+        self.ids    = id_hashes(raw['restaurant_id'])
+        self.hashes = row_hashes(raw)
+
+    @classmethod
+    def from_hashes(cls, ids, hashes):
+        rows = cls.__new__(cls)
+        rows.ids, rows.hashes = ids, hashes
+        return rows
+
+    @classmethod
+    def concat(cls, parts):
+        return cls.from_hashes(np.concatenate([part.ids for part in parts]),
+                               np.concatenate([part.hashes for part in parts]))
+
+    def changed_ids(self, new):
+        gone  = ~np.isin(self.hashes, new.hashes)
+        added = ~np.isin(new.hashes, self.hashes)
+        return np.union1d(self.ids[gone], new.ids[added])
+
+
+# ==========================================================
+#                    Delta application
+# ==========================================================
+
+def concat_clean(kept, delta):
+    # kept + delta with the dtypes of the clean table: categoricals are
+    # unioned, and compact re-derives the others as clean_code does.
+    columns = {}
+    for column in kept.columns:
+        if isinstance(kept[column].dtype, pd.CategoricalDtype):
+            values = pd.Series(union_categoricals([kept[column], delta[column].astype('category')],
+                                                  sort_categories=True))
+            if values.dtype not in FIXED_DTYPES:
+                values = values.cat.remove_unused_categories()
+        elif kept[column].dtype == bool:
+            values = pd.concat([kept[column], delta[column].astype(bool)], ignore_index=True)
+        else:
+            values = pd.concat([kept[column], delta[column]], ignore_index=True)
+        columns[column] = values.reset_index(drop=True)
+    return compact(pd.DataFrame(columns))
+
+
+def apply_delta(df, raw, ids, rates=None):
+    # Replaces the rows of the restaurants in ids (id hashes) with their rows
+    # of the new export, cleaned; returns the new table and the new rows.
+    delta = raw[np.isin(id_hashes(raw['restaurant_id']), ids)].copy()
+    delta = transform_columns(delta, rates)[list(df.columns)]
+    delta = drop_outliers(drop_duplicate_rows(delta)[0])
+    kept  = df[~np.isin(id_hashes(df['restaurant_id']), ids)]
+    return concat_clean(kept, delta), delta
+
+
+def refresh_entry(path, entry):
+    start = time.perf_counter()
+    mtime = os.stat(path).st_mtime_ns
+    content_hash = file_hash(path)
+    with stage('csv_read') as span:
+        raw = rename_columns(pd.read_csv(path))
+        span.rows_out = len(raw)
+    rows  = RowIndex(raw)
+    ids   = entry['rows'].changed_ids(rows)
+
+    # The kept rows are converted again if the rates changed meanwhile
+    rates, rates_version = get_rates_with_version()
+    old       = entry['df'] if entry['rates'] == rates_version else with_rates(entry['df'], rates)
+    removed   = old[np.isin(id_hashes(old['restaurant_id']), ids)]
+    with stage('apply_delta', rows_in=len(raw)) as span:
+        df, delta = apply_delta(old, raw, ids, rates)
+        span.rows_out = len(delta)
+    df        = freeze(df)
+
+    # Only the cube cells the changed restaurants fall in are recomputed
+    cube = cached_data_cube(entry['version']) if entry['rates'] == rates_version else None
+    if cube is not None:
+        cube = cube.patched(df, pd.concat([cell_keys(removed), cell_keys(delta)]))
+
+    stats = {'restaurants': len(ids), 'rows_removed': len(removed), 'rows_added': len(delta),
+             'rows': len(df), 'seconds': time.perf_counter() - start}
+    return {'hash': content_hash, 'rates': rates_version,
+            'version': dataset_version_for(content_hash, rates_version),
+            'df': df, 'mtime': mtime, 'rows': rows, 'cube': cube, 'refresh': stats}
+
+
+# ==========================================================
+#                   Background threads
+# ==========================================================
+
+def index_rows_async(path, entry):
+    # Indexes the export the cached table was cleaned from, so that the
+    # next export can be diffed against it. The index written next to the
+    # snapshot is used when it matches; otherwise the CSV is parsed again.
+    def run():
+        try:
+            rows = read_row_index(path, entry['hash'])
+            if rows is None:
+                raw = rename_columns(pd.read_csv(path))
+                if file_hash(path) == entry['hash']:
+                    rows = RowIndex(raw)
+            if rows is not None:
+                entry['rows'] = rows
+        except (OSError, ValueError) as error:
+            print('Error indexing dataset rows:', error)
+
+    threading.Thread(target=run, name='dishy-row-index', daemon=True).start()
+
+
+def refresh_async(path, entry):
+    def run():
+        try:
+            new_entry = refresh_entry(path, entry)
+        except Exception as error:
+            print('Incremental refresh failed, reloading the dataset:', error)
+            new_entry = None
+        cube = new_entry.pop('cube') if new_entry is not None else None
+        # The cube goes in first, so no page sees the new version without it
+        if cube is not None:
+            store_data_cube(new_entry['version'], cube)
+        swap_entry(path, entry, new_entry)
+        if new_entry is not None:
+            print('Refreshed {restaurants} restaurants (-{rows_removed}/+{rows_added} rows) '
+                  'in {seconds:.2f} s'.format(**new_entry['refresh']))
+
+    threading.Thread(target=run, name='dishy-refresh', daemon=True).start()
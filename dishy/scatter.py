@@ -0,0 +1,153 @@
+# ========================================
+# Import libraries
+# ========================================
+import os
+
+import numpy          as np
+import pandas         as pd
+
+from dishy.cleaning   import uncategorize
+from dishy.cube       import RATING_STEP
+from dishy.lazy       import lazy_import
+
+
+px = lazy_import('plotly.express')
+go = lazy_import('plotly.graph_objects')
+
+# Above this many restaurants the rating x cost scatter stops shipping one
+# point per row: DISHY_SCATTER_MODE=density draws a server-side 2D
+# histogram, DISHY_SCATTER_MODE=sample a sample stratified by country.
+# Cost outliers are always drawn as exact points, up to MAX_OUTLIERS; in
+# the histogram the outliers beyond that are counted in an overflow column
+# past the fence, so every row with a cost is counted.
+MAX_SCATTER_POINTS = int(os.environ.get('DISHY_MAX_SCATTER_POINTS', '10000'))
+SCATTER_MODE       = os.environ.get('DISHY_SCATTER_MODE', 'density')
+MAX_OUTLIERS       = 2_000
+# Costs above Q3 + OUTLIER_IQR * IQR are outliers
+OUTLIER_IQR        = 3.0
+COST_BINS          = 60
+SAMPLE_SEED        = 0
+
+X, Y       = 'average_cost_for_two_USD', 'aggregate_rating'
+HOVER_DATA = ['city', 'country_id']
+
+
+# ==========================================================
+#                      Row selection
+# ==========================================================
+
+def cost_fence(df):
+    cost = df[X].to_numpy(dtype='float64')
+    cost = cost[~np.isnan(cost)]
+    if len(cost) == 0:
+        return np.inf
+    q1, q3 = np.percentile(cost, [25, 75])
+    return q3 + OUTLIER_IQR * (q3 - q1)
+
+
+def cost_outliers(df, fence=None, max_outliers=MAX_OUTLIERS):
+    # Positions of the most expensive rows beyond the fence
+    fence = cost_fence(df) if fence is None else fence
+    cost  = df[X].to_numpy(dtype='float64')
+    rows  = np.flatnonzero(cost > fence)
+    if len(rows) > max_outliers:
+        top  = np.argpartition(-cost[rows], max_outliers - 1)[:max_outliers]
+        rows = np.sort(rows[top])
+    return rows
+
+
+def stratified_sample(df, by, n, seed=SAMPLE_SEED):
+    # Positions of about n rows, each group of `by` keeping its share of the
+    # rows (at least one); the same frame always gives the same sample.
+    codes, _ = pd.factorize(df[by])
+    codes = codes + 1                      # missing values (-1) form group 0
+    sizes = np.bincount(codes)
+    quota = np.where(sizes > 0, np.maximum(1, np.floor(sizes * n / max(len(df), 1))), 0)
+    # A random key per row; within a group the rows with the smallest keys win
+    keys   = np.random.default_rng(seed).random(len(df))
+    order  = np.lexsort((keys, codes))
+    starts = np.cumsum(sizes) - sizes
+    rank   = np.arange(len(order)) - starts[codes[order]]
+    keep   = order[rank < quota[codes[order]]]
+    return np.sort(keep)
+
+
+# ==========================================================
+#                      Density bins
+# ==========================================================
+
+def density_bins(df, fence, cost_bins=COST_BINS, drawn=None):
+    # Row counts per (rating bucket, cost bin); the rating buckets are the
+    # RATING_STEP of the ratings, the cost bins split [0, fence]. The rows
+    # past the fence that are not drawn as points (positions in drawn) are
+    # counted in one extra overflow bin, present when it is not empty.
+    rating = df[Y].to_numpy(dtype='float64')
+    cost   = df[X].to_numpy(dtype='float64')
+    valid  = ~np.isnan(cost) & ~np.isnan(rating)
+    over   = valid & (cost > fence)
+    if drawn is not None:
+        over[drawn] = False
+    binned = (valid & (cost <= fence)) | over
+    n_bins = cost_bins + 1 if over.any() else cost_bins
+
+    rating_bucket = np.round(rating[binned] / RATING_STEP).astype(np.int64)
+    top  = max(fence, 1e-9)
+    cost_bin = np.minimum((cost[binned] / top * cost_bins).astype(np.int64), cost_bins - 1)
+    cost_bin[over[binned]] = cost_bins
+    n_buckets = int(rating_bucket.max()) + 1 if len(rating_bucket) else 1
+    counts = np.bincount(rating_bucket * n_bins + cost_bin,
+                         minlength=n_buckets * n_bins).reshape(n_buckets, n_bins)
+    cost_centers   = (np.arange(n_bins) + 0.5) * top / cost_bins
+    rating_centers = np.arange(n_buckets) * RATING_STEP
+    return counts, cost_centers, rating_centers
+
+
+# ==========================================================
+#                         Figure
+# ==========================================================
+
+def point_figure(df):
+    return px.scatter(uncategorize(df.loc[:, [X, Y, 'cuisines', 'restaurant_name'] + HOVER_DATA]),
+                      y=Y, x=X,
+                      color='cuisines',
+                      hover_data=HOVER_DATA,
+                      hover_name='restaurant_name',
+                      size_max=30, render_mode='webgl')
+
+
+def density_figure(df, outliers, fence):
+    counts, cost_centers, rating_centers = density_bins(df, fence, drawn=outliers)
+    z = np.where(counts > 0, counts, np.nan)
+    # Hover label of every cost bin, the overflow bin included
+    step   = max(fence, 1e-9) / COST_BINS
+    labels = ['US$ {:,.0f}-{:,.0f}'.format(i * step, (i + 1) * step) for i in range(COST_BINS)]
+    labels += ['over US$ {:,.0f} (outliers not drawn as points)'.format(fence)] * (len(cost_centers) - COST_BINS)
+    fig = go.Figure(go.Heatmap(x=np.round(cost_centers, 2), y=np.round(rating_centers, 1), z=z,
+                               text=[labels] * len(rating_centers),
+                               colorscale='Blues', colorbar={'title': 'restaurants'},
+                               hovertemplate='%{text}<br>rating %{y}<br>%{z} restaurants<extra></extra>'))
+    points = df.iloc[outliers]
+    n_beyond = int(np.count_nonzero(df[X].to_numpy(dtype='float64') > fence))
+    name = 'cost outliers' if len(points) == n_beyond else \
+           'top {:,} of {:,} cost outliers (rest in the last column)'.format(len(points), n_beyond)
+    fig.add_trace(go.Scattergl(x=points[X], y=points[Y], mode='markers', name=name, showlegend=True,
+                               marker={'color': '#e45756', 'size': 6},
+                               text=points['restaurant_name'].astype(str),
+                               customdata=uncategorize(points[HOVER_DATA]).to_numpy(),
+                               hovertemplate='<b>%{text}</b><br>%{customdata[0]}, %{customdata[1]}'
+                                             '<br>US$ %{x}<br>rating %{y}<extra></extra>'))
+    fig.update_layout(xaxis_title=X, yaxis_title=Y)
+    return fig
+
+
+def rating_cost_figure(df, max_points=MAX_SCATTER_POINTS, mode=SCATTER_MODE):
+    # Every row as a WebGL point up to max_points; above it, a density
+    # heatmap or a stratified sample, with the cost outliers drawn exactly.
+    if len(df) <= max_points:
+        return point_figure(df)
+    fence    = cost_fence(df)
+    outliers = cost_outliers(df, fence)
+    if mode == 'sample':
+        rows = np.union1d(stratified_sample(df, 'country_id', max_points), outliers)
+        return point_figure(df.iloc[rows])
+    return density_figure(df, outliers, fence)
@@ -0,0 +1,72 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+
+import numpy          as np
+import pandas         as pd
+
+
+# ==========================================================
+#                   Compact table schema
+# ==========================================================
+# Every app replica keeps its own copy of the clean table, so the columns
+# are stored in the smallest dtype that holds their values: yes/no flags
+# as bool, small integers downcast, ratings as float32 and repeated
+# strings as categoricals.
+
+BOOLEAN_COLUMNS = ['has_table_booking', 'has_online_delivery', 'is_delivering_now']
+INTEGER_COLUMNS = ['country_code', 'price_range', 'votes', 'average_cost_for_two']
+FLOAT32_COLUMNS = ['aggregate_rating']
+
+# Object columns whose distinct values are at most this share of the rows
+# are stored as categoricals (currency, locality, rating_text, ...).
+CATEGORY_MAX_RATIO = 0.5
+
+
+def compact(df):
+    df = df.copy()
+    for column in BOOLEAN_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype(bool)
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+    for column in FLOAT32_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype(np.float32)
+    for column in df.select_dtypes('object').columns:
+        if df[column].nunique() <= CATEGORY_MAX_RATIO * len(df):
+            df[column] = df[column].astype('category')
+    return df
+
+
+def memory_report(df, baseline=None):
+    report = pd.DataFrame({'dtype': df.dtypes.astype(str),
+                           'bytes': df.memory_usage(index=False, deep=True)})
+    if baseline is not None:
+        report.insert(0, 'baseline_dtype', baseline.dtypes.astype(str))
+        report.insert(1, 'baseline_bytes', baseline.memory_usage(index=False, deep=True))
+    report.loc['TOTAL'] = report.sum(numeric_only=True)
+    if baseline is not None:
+        report['saved_%'] = (1 - report['bytes'] / report['baseline_bytes']) * 100
+    return report
+
+
+def main():
+    from dishy.cleaning import clean_code
+    from dishy.data     import DATASET_PATH
+
+    parser = argparse.ArgumentParser(description='Memory use per column of the clean table')
+    parser.add_argument('--csv', default=DATASET_PATH)
+    args = parser.parse_args()
+
+    compact_df = clean_code(pd.read_csv(args.csv))
+    baseline   = compact_df.astype({column: object for column in compact_df.select_dtypes('category')})
+    baseline   = baseline.astype({column: np.int64 for column in BOOLEAN_COLUMNS + INTEGER_COLUMNS})
+    baseline   = baseline.astype({column: np.float64 for column in FLOAT32_COLUMNS})
+    print(memory_report(compact_df, baseline).to_string(float_format='{:.1f}'.format))
+
+
+if __name__ == '__main__':
+    main()
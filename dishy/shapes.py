@@ -0,0 +1,113 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+import json
+import os
+import threading
+
+from dishy.cleaning   import COUNTRIES_ISO
+from dishy.trace      import stage
+
+
+SHAPES_PATH    = 'dataset/country_shapes.json'
+SHAPES_VERSION = 1
+
+# (minimum map zoom, simplification tolerance in degrees): the coarser
+# outlines are used while the map is zoomed out, where detail is invisible.
+# The Countries page draws a static map at zoom 1.5, so only the coarsest
+# level is built; finer levels would need switching on the client as the
+# map zooms.
+ZOOM_LEVELS = [
+    (0, 0.5),
+]
+COORDINATE_DECIMALS = 3
+
+
+# ==========================================================
+#                     Offline build
+# ==========================================================
+# Needs geopandas; the app itself only reads the JSON file written here.
+
+def round_coordinates(coordinates, decimals=COORDINATE_DECIMALS):
+    if isinstance(coordinates[0], (int, float)):
+        return [round(value, decimals) for value in coordinates]
+    return [round_coordinates(part, decimals) for part in coordinates]
+
+
+def build_shapes(path=SHAPES_PATH, iso_codes=None):
+    import geopandas      as gpd
+    from shapely.geometry import mapping
+
+    iso_codes = iso_codes or [info['iso_alpha'] for info in COUNTRIES_ISO.values()]
+    with stage('gpd_read_file') as span:
+        world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
+        span.rows_out = len(world)
+    countries = world[world['iso_a3'].isin(iso_codes)]
+
+    levels = {}
+    for _, tolerance in ZOOM_LEVELS:
+        geometries = countries.geometry.simplify(tolerance, preserve_topology=True)
+        features   = []
+        for (_, country), geometry in zip(countries.iterrows(), geometries):
+            shape = mapping(geometry)
+            features.append({
+                'type': 'Feature',
+                'properties': {'name': country['name'], 'ISO_Alpha': country['iso_a3']},
+                'geometry': {'type': shape['type'],
+                             'coordinates': round_coordinates(shape['coordinates'])},
+            })
+        levels[str(tolerance)] = {'type': 'FeatureCollection', 'features': features}
+
+    shapes = {'version': SHAPES_VERSION, 'levels': levels}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(shapes, f, separators=(',', ':'))
+    return shapes
+
+
+# ==========================================================
+#                   Process-wide layer
+# ==========================================================
+
+_shapes      = None
+_shapes_lock = threading.Lock()
+
+
+def load_shapes(path=SHAPES_PATH):
+    global _shapes
+    with _shapes_lock:
+        if _shapes is None:
+            with stage('shapes_read'), open(path, encoding='utf-8') as f:
+                shapes = json.load(f)
+            # Index every level by ISO code once, selections are then lookups
+            _shapes = {tolerance: {feature['properties']['ISO_Alpha']: feature
+                                   for feature in collection['features']}
+                       for tolerance, collection in shapes['levels'].items()}
+        return _shapes
+
+
+def tolerance_for_zoom(zoom):
+    tolerance = ZOOM_LEVELS[0][1]
+    for min_zoom, level_tolerance in ZOOM_LEVELS:
+        if zoom >= min_zoom:
+            tolerance = level_tolerance
+    return tolerance
+
+
+def country_layer(iso_codes, zoom=0):
+    features = load_shapes()[str(tolerance_for_zoom(zoom))]
+    return {'type': 'FeatureCollection',
+            'features': [features[code] for code in iso_codes if code in features]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the simplified country outlines layer')
+    parser.add_argument('--output', default=SHAPES_PATH)
+    args = parser.parse_args()
+
+    build_shapes(args.output)
+    print('Wrote {} ({:.1f} kB)'.format(args.output, os.path.getsize(args.output) / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+# ========================================
+# Import libraries
+# ========================================
+import argparse
+import json
+import os
+import time
+
+import pandas         as pd
+
+from dishy.cleaning   import clean_code, rename_columns
+from dishy.data       import DATASET_PATH, file_hash
+from dishy.dedup      import drop_duplicate_rows
+from dishy.fx         import get_rate_cache
+
+try:
+    import pyarrow         as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = feather = None
+
+
+# Bump whenever clean_code changes the columns or dtypes it produces, so
+# older snapshots are treated as stale and rebuilt.
+SNAPSHOT_VERSION = 3
+METADATA_KEY     = b'dishy'
+SNAPSHOT_CATEGORIES = ['country_id', 'city', 'cuisines', 'price_type', 'rating_color']
+
+
+# ==========================================================
+#                       Functions
+# ==========================================================
+# The snapshot is an uncompressed Feather (Arrow IPC) file holding the
+# output of clean_code, so the app can memory-map it at startup instead
+# of parsing and cleaning the CSV. Its schema metadata records the
+# snapshot version and the hash of the CSV it was built from: a snapshot
+# whose version or source hash does not match is ignored.
+
+def snapshot_path_for(csv_path=DATASET_PATH):
+    return os.path.splitext(csv_path)[0] + '.clean.feather'
+
+
+def row_index_path_for(csv_path=DATASET_PATH):
+    return os.path.splitext(csv_path)[0] + '.rows.feather'
+
+
+def validate(df):
+    missing = [column for column in SNAPSHOT_CATEGORIES if column not in df.columns]
+    if missing:
+        raise ValueError('Snapshot is missing columns: {}'.format(missing))
+    not_categorical = [column for column in SNAPSHOT_CATEGORIES
+                       if not isinstance(df[column].dtype, pd.CategoricalDtype)]
+    if not_categorical:
+        raise ValueError('Snapshot columns are not categorical: {}'.format(not_categorical))
+    if df['average_cost_for_two_USD'].isna().all():
+        raise ValueError('Snapshot has no converted costs')
+
+
+def validate_written(path, n_rows):
+    # Checks the file just written from its Arrow schema and columns,
+    # without converting it to pandas
+    table = feather.read_table(path, memory_map=True)
+    if table.num_rows != n_rows:
+        raise ValueError('Snapshot has {} rows instead of {}'.format(table.num_rows, n_rows))
+    not_categorical = [column for column in SNAPSHOT_CATEGORIES
+                       if column not in table.column_names
+                       or not pa.types.is_dictionary(table.schema.field(column).type)]
+    if not_categorical:
+        raise ValueError('Snapshot columns are missing or not categorical: {}'.format(not_categorical))
+    if table.column('average_cost_for_two_USD').null_count == n_rows:
+        raise ValueError('Snapshot has no converted costs')
+
+
+def build_snapshot(csv_path=DATASET_PATH, snapshot_path=None, chunk_size=None):
+    if feather is None:
+        raise RuntimeError('pyarrow is required to build the clean snapshot')
+    snapshot_path = snapshot_path or snapshot_path_for(csv_path)
+    source_hash   = file_hash(csv_path)
+
+    def metadata_for(stats):
+        return {
+            'version':     SNAPSHOT_VERSION,
+            'source':      os.path.basename(csv_path),
+            'source_hash': source_hash,
+            'rows':        stats['rows'],
+            'duplicates':  stats['duplicates'],
+            'built_at':    int(time.time()),
+            'rates_fetched_at': getattr(get_rate_cache().snapshot, 'fetched_at', None),
+        }
+
+    # Written next to the target and swapped, so readers never see half a file
+    tmp_path = snapshot_path + '.tmp'
+    stats = {}
+    if chunk_size:
+        # Streamed chunk by chunk: neither the CSV nor the clean table is
+        # ever whole in memory (dishy.ingest.write_clean_chunks)
+        from dishy.ingest import clean_chunks, write_clean_chunks
+        encoded = lambda stats: {METADATA_KEY: json.dumps(metadata_for(stats)).encode('utf-8')}
+        write_clean_chunks(clean_chunks(csv_path, chunk_size, stats), tmp_path, stats, encoded)
+        rows = stats['row_index']
+    else:
+        from dishy.refresh import RowIndex
+        raw = pd.read_csv(csv_path)
+        rows = RowIndex(rename_columns(raw))
+        df  = clean_code(raw, stats)
+        stats['rows'] = len(df)
+        validate(df)
+        if drop_duplicate_rows(df)[1]:
+            raise ValueError('Snapshot contains duplicated rows')
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata,
+                                               METADATA_KEY: json.dumps(metadata_for(stats)).encode('utf-8')})
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+
+    try:
+        validate_written(tmp_path, stats['rows'])
+    except ValueError:
+        os.remove(tmp_path)
+        raise
+    metadata = read_metadata(tmp_path)
+    os.replace(tmp_path, snapshot_path)
+
+    # The row hashes of the export, so that a process starting from the
+    # snapshot can diff the next export without parsing this one again
+    write_row_index(rows, row_index_path_for(csv_path), source_hash)
+    return metadata
+
+
+def read_metadata(path):
+    # Only the schema of the file is read, not its columns
+    with pa.memory_map(path) as source:
+        schema = pa.ipc.open_file(source).schema
+    return json.loads((schema.metadata or {}).get(METADATA_KEY, b'{}'))
+
+
+def read_snapshot(snapshot_path, source_hash=None):
+    # (frame, metadata), or None when the file is missing, was built by
+    # another SNAPSHOT_VERSION or (given source_hash) from a different CSV;
+    # the columns are only converted once the metadata matches.
+    if feather is None or not os.path.exists(snapshot_path):
+        return None
+    metadata = read_metadata(snapshot_path)
+    if metadata.get('version') != SNAPSHOT_VERSION:
+        return None
+    if source_hash is not None and metadata.get('source_hash') != source_hash:
+        return None
+    table = feather.read_table(snapshot_path, memory_map=True)
+    return table.to_pandas(), metadata
+
+
+def write_row_index(rows, path, source_hash):
+    table = pa.table({'ids': rows.ids, 'hashes': rows.hashes})
+    metadata = {'version': SNAPSHOT_VERSION, 'source_hash': source_hash}
+    table = table.replace_schema_metadata({METADATA_KEY: json.dumps(metadata).encode('utf-8')})
+    tmp_path = path + '.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+
+def read_row_index(csv_path, source_hash):
+    # The RowIndex written by build_snapshot for the export with this
+    # content hash, or None
+    path = row_index_path_for(csv_path)
+    if feather is None or not os.path.exists(path):
+        return None
+    try:
+        metadata = read_metadata(path)
+        if metadata.get('version') != SNAPSHOT_VERSION or metadata.get('source_hash') != source_hash:
+            return None
+        table = feather.read_table(path)
+    except (OSError, ValueError) as error:
+        print('Error reading row index:', error)
+        return None
+    from dishy.refresh import RowIndex
+    return RowIndex.from_hashes(table['ids'].to_numpy(), table['hashes'].to_numpy())
+
+
+def load_snapshot(csv_path=DATASET_PATH, source_hash=None, snapshot_path=None):
+    # Returns the clean frame, or None when the snapshot is missing, was
+    # built by another SNAPSHOT_VERSION or from a different CSV.
+    snapshot_path = snapshot_path or snapshot_path_for(csv_path)
+    try:
+        result = read_snapshot(snapshot_path, source_hash or file_hash(csv_path))
+    except (OSError, ValueError) as error:
+        print('Error reading clean snapshot:', error)
+        return None
+    if result is None:
+        return None
+    df, _ = result
+    try:
+        validate(df)
+    except ValueError as error:
+        print('Error validating clean snapshot:', error)
+        return None
+    return df
+
+
+# ==========================================================
+#                     Command line
+# ==========================================================
+
+def report(csv_path=DATASET_PATH, reruns=20):
+    from dishy import data
+
+    def timed(func):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+
+    rows = []
+    for source, use_snapshot in [('csv', False), ('snapshot', True)]:
+        data.clear_cache()
+        data.USE_SNAPSHOT = use_snapshot
+        cold  = timed(lambda: data.load_dataset(csv_path))
+        rerun = min(timed(lambda: data.load_dataset(csv_path)) for _ in range(reruns))
+        rows.append([source, cold, rerun])
+    data.USE_SNAPSHOT = True
+    print(pd.DataFrame(rows, columns=['source', 'cold_start_s', 'rerun_s']).to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the clean columnar snapshot of the zomato dataset')
+    parser.add_argument('command', choices=['build', 'report'])
+    parser.add_argument('--csv', default=DATASET_PATH)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='clean the CSV in chunks of this many rows')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        metadata = build_snapshot(args.csv, args.output, args.chunk_size)
+        print('Wrote {} ({} rows, {} duplicates dropped, version {})'.format(
+            args.output or snapshot_path_for(args.csv), metadata['rows'], metadata['duplicates'], metadata['version']))
+    else:
+        report(args.csv)
+
+
+if __name__ == '__main__':
+    main()
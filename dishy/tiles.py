@@ -0,0 +1,182 @@
+# ========================================
+# Import libraries
+# ========================================
+import threading
+
+from collections      import OrderedDict
+
+import numpy          as np
+import pandas         as pd
+
+
+MAX_ZOOM     = 16
+MAX_LATITUDE = 85.05112878
+# Per-tile totals of the recent (filter state, zoom) pairs, per pyramid
+TILE_SUMS_BYTES = 32 * 1024 * 1024
+
+
+# ==========================================================
+#                   Tile coordinates
+# ==========================================================
+# Points are assigned to the Web Mercator tiles of MAX_ZOOM and sorted by
+# the Morton (Z-order) code of their tile. With that order every tile of a
+# coarser zoom level is one contiguous run of rows, so a single sort serves
+# the whole pyramid: level z only stores where each of its tiles starts.
+
+def tile_xy(latitude, longitude, zoom):
+    n   = 1 << zoom
+    lat = np.radians(np.clip(latitude, -MAX_LATITUDE, MAX_LATITUDE))
+    x   = (np.asarray(longitude, dtype='float64') + 180.0) / 360.0 * n
+    y   = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0 * n
+    x   = np.clip(np.floor(x), 0, n - 1).astype(np.uint32)
+    y   = np.clip(np.floor(y), 0, n - 1).astype(np.uint32)
+    return x, y
+
+
+def _spread_bits(v):
+    v = v.astype(np.uint64) & np.uint64(0xFFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x33333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x55555555)
+    return v
+
+
+def _compact_bits(v):
+    v = v & np.uint64(0x55555555)
+    v = (v | (v >> np.uint64(1))) & np.uint64(0x33333333)
+    v = (v | (v >> np.uint64(2))) & np.uint64(0x0F0F0F0F)
+    v = (v | (v >> np.uint64(4))) & np.uint64(0x00FF00FF)
+    v = (v | (v >> np.uint64(8))) & np.uint64(0x0000FFFF)
+    return v
+
+
+def morton(x, y):
+    return _spread_bits(x) | (_spread_bits(y) << np.uint64(1))
+
+
+def unmorton(code):
+    x, y = _compact_bits(code), _compact_bits(code >> np.uint64(1))
+    return x.astype(np.uint32), y.astype(np.uint32)
+
+
+# ==========================================================
+#                     Point pyramid
+# ==========================================================
+
+class PointPyramid:
+    def __init__(self, latitude, longitude, max_zoom=MAX_ZOOM):
+        latitude  = np.asarray(latitude, dtype='float64')
+        longitude = np.asarray(longitude, dtype='float64')
+        x, y      = tile_xy(latitude, longitude, max_zoom)
+        codes     = morton(x, y)
+
+        self.max_zoom  = max_zoom
+        self.n_rows    = len(codes)
+        offset         = np.int32 if self.n_rows < 2**31 else np.int64
+        self.order     = np.argsort(codes, kind='stable').astype(offset)
+        codes          = codes[self.order]
+        self.latitude  = latitude[self.order]
+        self.longitude = longitude[self.order]
+
+        # Per zoom level: tile coordinates and first sorted row of every
+        # tile; a tile ends where the next one starts.
+        self.levels = []
+        for zoom in range(max_zoom + 1):
+            level_codes = codes >> np.uint64(2 * (max_zoom - zoom))
+            tiles, starts = np.unique(level_codes, return_index=True)
+            tile_x, tile_y = unmorton(tiles)
+            self.levels.append({'x': tile_x, 'y': tile_y, 'starts': starts.astype(offset)})
+
+        self._sums       = OrderedDict()
+        self._sums_bytes = 0
+        self._sums_lock  = threading.Lock()
+
+    def tile_sums(self, zoom, mask=None, key=None):
+        # Totals of (count, latitude, longitude) of every tile of a zoom
+        # level, from one np.add.reduceat pass over the rows in tile order.
+        # The totals of a filter are kept under (key, zoom), most recently
+        # used first, within TILE_SUMS_BYTES.
+        cache_key = (key, zoom) if key is not None or mask is None else None
+        with self._sums_lock:
+            if cache_key in self._sums:
+                self._sums.move_to_end(cache_key)
+                return self._sums[cache_key]
+
+        starts = self.levels[zoom]['starts']
+        if self.n_rows == 0:
+            sums = (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0))
+        elif mask is None:
+            sums = (np.diff(np.append(starts, self.n_rows)).astype(np.int64),
+                    np.add.reduceat(self.latitude, starts),
+                    np.add.reduceat(self.longitude, starts))
+        else:
+            weight = np.asarray(mask, dtype=bool)[self.order]
+            sums = (np.add.reduceat(weight, starts, dtype=np.int64),
+                    np.add.reduceat(np.where(weight, self.latitude, 0.0), starts),
+                    np.add.reduceat(np.where(weight, self.longitude, 0.0), starts))
+
+        if cache_key is not None:
+            size = sum(values.nbytes for values in sums)
+            with self._sums_lock:
+                if cache_key not in self._sums and size <= TILE_SUMS_BYTES:
+                    self._sums[cache_key] = sums
+                    self._sums_bytes += size
+                    while self._sums_bytes > TILE_SUMS_BYTES:
+                        _, evicted = self._sums.popitem(last=False)
+                        self._sums_bytes -= sum(values.nbytes for values in evicted)
+        return sums
+
+    def clusters(self, zoom, bounds=None, mask=None, key=None):
+        # bounds = (south, west, north, east); mask = boolean array over the
+        # rows the pyramid was built from (the active filters).
+        zoom  = int(min(max(zoom, 0), self.max_zoom))
+        level = self.levels[zoom]
+        tiles = np.ones(len(level['x']), dtype=bool)
+        if bounds is not None:
+            south, west, north, east = bounds
+            x0, y0 = tile_xy(np.array([north]), np.array([west]), zoom)
+            x1, y1 = tile_xy(np.array([south]), np.array([east]), zoom)
+            tiles &= (level['y'] >= y0[0]) & (level['y'] <= y1[0])
+            if x0[0] <= x1[0]:
+                tiles &= (level['x'] >= x0[0]) & (level['x'] <= x1[0])
+            else:
+                # viewport crossing the antimeridian
+                tiles &= (level['x'] >= x0[0]) | (level['x'] <= x1[0])
+
+        count, lat_sum, lon_sum = self.tile_sums(zoom, mask, key)
+        tiles = tiles & (count > 0)
+        n = count[tiles]
+        return pd.DataFrame({
+            'tile_x':       level['x'][tiles],
+            'tile_y':       level['y'][tiles],
+            'latitude':     lat_sum[tiles] / n,
+            'longitude':    lon_sum[tiles] / n,
+            'n_restaurant': n,
+        })
+
+
+# ==========================================================
+#                 Process-wide pyramids
+# ==========================================================
+
+_pyramids      = {}
+_pyramids_lock = threading.Lock()
+
+
+def point_pyramid(df, version):
+    # One pyramid per dataset version, shared by every session
+    with _pyramids_lock:
+        pyramid = _pyramids.get(version)
+        if pyramid is None:
+            pyramid = PointPyramid(df['latitude'].to_numpy(), df['longitude'].to_numpy())
+            _pyramids.clear()
+            _pyramids[version] = pyramid
+        return pyramid
+
+
+def rows_mask(filtered, n_rows):
+    # The filtered frame keeps the row labels of the full table
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[filtered.index.to_numpy()] = True
+    return mask
@@ -0,0 +1,64 @@
+# ========================================
+# Import libraries
+# ========================================
+import numpy          as np
+import pandas         as pd
+
+
+# ==========================================================
+#                     Partial selection
+# ==========================================================
+# The rankings only show their first k rows, so instead of sorting the
+# whole frame the first sort key is partitioned around its k-th value
+# (np.partition, O(n)) and only the rows that can still make the top k,
+# i.e. those up to and including ties with that value, are sorted on all
+# keys. Ties keep the row order of the frame, as a stable sort would, and
+# NaNs come last.
+
+def _sort_key(values, ascending):
+    values = np.asarray(values, dtype='float64')
+    return values if ascending else -values
+
+
+def top_k_positions(columns, k, ascending=False):
+    if isinstance(ascending, bool):
+        ascending = [ascending] * len(columns)
+    keys = [_sort_key(values, asc) for values, asc in zip(columns, ascending)]
+    n = len(keys[0])
+    k = max(min(k, n), 0)
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        kth = np.partition(keys[0], k - 1)[k - 1]
+        candidates = np.arange(n) if np.isnan(kth) else np.flatnonzero(keys[0] <= kth)
+    else:
+        candidates = np.arange(n)
+    # np.lexsort sorts on its last key first
+    order = np.lexsort([candidates] + [key[candidates] for key in reversed(keys)])
+    return candidates[order[:k]]
+
+
+def top_k(df, by, k, ascending=False):
+    # Same rows, in the same order, as df.sort_values(by, ascending, kind='stable').head(k)
+    by = [by] if isinstance(by, str) else list(by)
+    positions = top_k_positions([df[column].to_numpy() for column in by], k, ascending)
+    return df.iloc[positions]
+
+
+# ==========================================================
+#                     Top n per group
+# ==========================================================
+
+def top_n_per_group(df, group, label, column, n, other='Other'):
+    # df has one row per (group, label) with a count in column. Keeps the n
+    # largest labels of every group and folds the rest into one `other` row
+    # per group, so the result has at most n + 1 rows per group.
+    rank = df.groupby(group, observed=True, sort=False)[column].rank(method='first', ascending=False)
+    keep = (rank <= n).to_numpy()
+    rest = (df.loc[~keep]
+              .groupby(group, observed=True, sort=True)[column]
+              .sum()
+              .reset_index()
+              .assign(**{label: other})
+           )
+    return pd.concat([df.loc[keep, [group, label, column]], rest[[group, label, column]]], ignore_index=True)
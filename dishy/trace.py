@@ -0,0 +1,215 @@
+# ========================================
+# Import libraries
+# ========================================
+import json
+import os
+import threading
+import time
+
+from collections      import deque
+from contextlib       import contextmanager
+
+
+# DISHY_TRACE=0 turns the stage timers off; DISHY_TRACE_PANEL=1 adds the
+# performance panel to the sidebar of every page; DISHY_TRACE_JSONL appends
+# every finished stage to that file as one JSON line.
+ENABLED    = os.environ.get('DISHY_TRACE', '1') != '0'
+SHOW_PANEL = os.environ.get('DISHY_TRACE_PANEL', '0') == '1'
+JSONL_PATH = os.environ.get('DISHY_TRACE_JSONL')
+# Stages kept in memory for the exports, across all sessions
+MAX_RECORDS = 5000
+
+
+# ==========================================================
+#                     Stage records
+# ==========================================================
+# A stage is a named block of work (CSV read, clean_code, FX rates, ...)
+# timed with perf_counter. Each record carries the rows going in and out
+# when the stage has any, and the change in resident memory of the process
+# across the block. Memory is process-wide: with several sessions running
+# at once the delta of one stage also includes what the others allocated.
+#
+#   with stage('clean_code', rows_in=len(raw)) as span:
+#       df = clean_code(raw)
+#       span.rows_out = len(df)
+#
+# Records of a Streamlit rerun are grouped by the run started with
+# begin_run() on the script thread; stages of background threads (refresh,
+# geocoder) are only kept in the process-wide log.
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def rss_bytes():
+    # Resident set size; None where /proc is not available
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Span:
+    def __init__(self, name, rows_in=None, run=None):
+        self.name     = name
+        self.rows_in  = rows_in
+        self.rows_out = None
+        self.run      = run
+        self.thread   = threading.current_thread().name
+        self.depth    = getattr(_local, 'depth', 0)
+        self.start    = time.time()
+        self.seconds  = None
+        self.memory   = None
+        self.error    = None
+
+    def as_dict(self):
+        return {'stage': self.name, 'run': self.run, 'thread': self.thread, 'depth': self.depth,
+                'start': self.start, 'seconds': self.seconds, 'rows_in': self.rows_in,
+                'rows_out': self.rows_out, 'memory_delta': self.memory, 'error': self.error}
+
+
+_records      = deque(maxlen=MAX_RECORDS)
+_records_lock = threading.Lock()
+_local        = threading.local()
+
+
+def begin_run(page):
+    # Starts the record list of a rerun of page on the current thread
+    _local.run     = '{}-{}'.format(page, time.time_ns())
+    _local.spans   = []
+    _local.started = time.perf_counter()
+    return _local.run
+
+
+def run_spans():
+    return list(getattr(_local, 'spans', []))
+
+
+def _finish(span):
+    with _records_lock:
+        _records.append(span)
+    if JSONL_PATH:
+        try:
+            with open(JSONL_PATH, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(span.as_dict()) + '\n')
+        except OSError as error:
+            print('Error writing trace record:', error)
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    run  = getattr(_local, 'run', None)
+    span = Span(name, rows_in, run)
+    if not ENABLED:
+        yield span
+        return
+    memory = rss_bytes()
+    start  = time.perf_counter()
+    _local.depth = span.depth + 1
+    try:
+        yield span
+    except BaseException as error:
+        span.error = type(error).__name__
+        raise
+    finally:
+        span.seconds = time.perf_counter() - start
+        _local.depth = span.depth
+        if memory is not None:
+            span.memory = rss_bytes() - memory
+        if run is not None and getattr(_local, 'run', None) == run:
+            _local.spans.append(span)
+        _finish(span)
+
+
+def records():
+    with _records_lock:
+        return list(_records)
+
+
+def clear_records():
+    with _records_lock:
+        _records.clear()
+
+
+# ==========================================================
+#                         Exports
+# ==========================================================
+
+def to_jsonl(spans=None):
+    spans = records() if spans is None else spans
+    return ''.join(json.dumps(span.as_dict()) + '\n' for span in spans)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(spans=None):
+    # Prometheus text exposition format, one series per stage name
+    spans  = records() if spans is None else spans
+    totals = {}
+    for span in spans:
+        total = totals.setdefault(span.name, {'count': 0, 'seconds': 0.0, 'rows_out': 0,
+                                              'errors': 0, 'last': 0.0, 'memory': 0})
+        total['count']    += 1
+        total['seconds']  += span.seconds or 0.0
+        total['rows_out'] += span.rows_out or 0
+        total['errors']   += span.error is not None
+        total['last']      = span.seconds or 0.0
+        total['memory']    = span.memory or 0
+
+    # (metric, type, help, samples as (suffix, key))
+    metrics = [
+        ('dishy_stage_seconds',            'summary', 'Wall time spent in the stage',
+         [('_sum', 'seconds'), ('_count', 'count')]),
+        ('dishy_stage_last_seconds',       'gauge',   'Wall time of the last run of the stage',   [('', 'last')]),
+        ('dishy_stage_rows_out_total',     'counter', 'Rows produced by the stage',               [('', 'rows_out')]),
+        ('dishy_stage_memory_delta_bytes', 'gauge',   'Resident memory change across the last run of the stage',
+         [('', 'memory')]),
+        ('dishy_stage_errors_total',       'counter', 'Runs of the stage that raised',            [('', 'errors')]),
+    ]
+    lines = []
+    for metric, kind, help_text, samples in metrics:
+        lines.append('# HELP {} {}'.format(metric, help_text))
+        lines.append('# TYPE {} {}'.format(metric, kind))
+        for name, total in sorted(totals.items()):
+            for suffix, key in samples:
+                lines.append('{}{}{{stage="{}"}} {}'.format(metric, suffix, _label(name), total[key]))
+    return '\n'.join(lines) + '\n'
+
+
+# ==========================================================
+#                   Sidebar panel
+# ==========================================================
+
+def performance_panel(force=False):
+    # Stages of the current rerun, at the bottom of the sidebar; the
+    # download buttons export every stage recorded by the process.
+    if not (SHOW_PANEL or force):
+        return None
+    import pandas    as pd
+    import streamlit as st
+
+    spans = run_spans()
+    with st.sidebar.expander('Performance'):
+        if not spans:
+            st.caption('No stage recorded in this run')
+        else:
+            table = pd.DataFrame([span.as_dict() for span in spans])
+            table['ms'] = (table['seconds'] * 1000).round(1)
+            table['memory_MB'] = (table['memory_delta'] / 2**20).round(1)
+            # Nested stages are indented under the stage they ran in
+            table['stage'] = table['depth'].map(lambda depth: '· ' * depth) + table['stage']
+            st.dataframe(table[['stage', 'ms', 'rows_in', 'rows_out', 'memory_MB']],
+                         use_container_width=True)
+        started = getattr(_local, 'started', None)
+        if started is not None:
+            st.caption('Rerun so far: {:.0f} ms'.format((time.perf_counter() - started) * 1000))
+        st.download_button('Prometheus metrics', to_prometheus(), file_name='dishy_stages.prom')
+        st.download_button('JSONL records', to_jsonl(), file_name='dishy_stages.jsonl')
+    return None
@@ -2,102 +2,30 @@
 # Import libraries
 # ========================================
 # import hvplot.pandas
-import folium
-import inflection
-import pandas         as pd
-import geopandas      as gpd
-import plotly.express as px
 import streamlit      as st
-import numpy          as np
 
-from streamlit_folium import folium_static
-from geopy.geocoders  import Nominatim
-from PIL              import Image
+from dishy.aggregates import cached_aggregate
+from dishy.cleaning   import uncategorize
+from dishy.cube       import RATING_STEP, cube_aggregate, cube_metrics
+from dishy.data       import load_dataset
+from dishy.figures    import cached_figure
+from dishy.filters    import apply_filters
+from dishy.geo        import resolve_many
+from dishy.lazy       import lazy_function, lazy_import
+from dishy.shapes     import country_layer
+from dishy.trace      import begin_run, performance_panel, stage
+
+# Heavy dependencies are imported when first used, see dishy/lazy.py
+folium        = lazy_import('folium')
+px            = lazy_import('plotly.express')
+Image         = lazy_import('PIL.Image')
+folium_static = lazy_function('streamlit_folium', 'folium_static')
 
 
 # ==========================================================
 #                       Functions
 # ==========================================================
 
-def rename_columns(dataframe):
-    df = dataframe.copy()
-    title      = lambda x: inflection.titleize(x)
-    snakecase  = lambda x: inflection.underscore(x)
-    spaces     = lambda x: x.replace(" ", "")
-    cols_old   = list(df.columns)
-    cols_old   = list(map(title, cols_old))
-    cols_old   = list(map(spaces, cols_old))
-    cols_new   = list(map(snakecase, cols_old))
-    df.columns = cols_new
-    return df
-
-
-COUNTRIES_ISO = {
-    1:  {"country_id": "India",                     "iso_alpha": "IND"},
-    14: {"country_id": "Australia",                 "iso_alpha": "AUS"},
-    30: {"country_id": "Brazil",                    "iso_alpha": "BRA"},
-    37: {"country_id": "Canada",                    "iso_alpha": "CAN"},
-    94: {"country_id": "Indonesia",                 "iso_alpha": "IDN"},
-    148: {"country_id": "New Zealand",              "iso_alpha": "NZL"},
-    162: {"country_id": "Philippines",              "iso_alpha": "PHL"},
-    166: {"country_id": "Qatar",                    "iso_alpha": "QAT"},
-    184: {"country_id": "Singapore",                "iso_alpha": "SGP"},
-    189: {"country_id": "South Africa",             "iso_alpha": "ZAF"},
-    191: {"country_id": "Sri Lanka",                "iso_alpha": "LKA"},
-    208: {"country_id": "Turkey",                   "iso_alpha": "TUR"},
-    214: {"country_id": "United Arab Emirates",     "iso_alpha": "ARE"},
-    215: {"country_id": "United Kingdom",           "iso_alpha": "GBR"},
-    216: {"country_id": "United States of America", "iso_alpha": "USA"},
-}
-def get_country_info(country_id):
-    country_info = COUNTRIES_ISO.get(country_id)
-    return country_info["country_id"], country_info["iso_alpha"]
-
-
-def create_price_type(price_range):
-    if price_range == 1:
-        return "cheap"
-    elif price_range == 2:
-        return "normal"
-    elif price_range == 3:
-        return "expensive"
-    else:
-        return "gourmet"
-
-
-COLORS = {
-    "3F7E00": "darkgreen",
-    "5BA829": "green",
-    "9ACD32": "lightgreen",
-    "CDD614": "pear",
-    "FFBA00": "darkyellow",
-    "CBCBC8": "silver",
-    "FF7800": "orange",
-    }
-def color_name(color_code):
-    return COLORS[color_code]
-
-
-def count_unique_values(df):
-    unique_counts = df.nunique().reset_index()
-    unique_counts.columns = ['Column', 'Unique Count']
-    return unique_counts
-
-
-def drop_single_value_columns(df):
-    unique_counts = count_unique_values(df)
-    single_value_columns = unique_counts[unique_counts['Unique Count'] == 1]['Column']
-    return df.drop(single_value_columns, axis=1)
-
-
-def check_nulls(df):
-    nulls_per_column = df.isnull().sum()
-    total_values_per_column = df.shape[0]
-    percent_null_per_column = (nulls_per_column / total_values_per_column) * 100
-    return pd.DataFrame({'Column': nulls_per_column.index,
-                         'Percent_nulls': percent_null_per_column.values})
-
-
 # Function for styling country outlines
 def style_function(feature):
     return {
@@ -107,107 +35,92 @@ def style_function(feature):
     }
  
     
-def clean_code(df):
-    df = drop_single_value_columns(df)
-    df = rename_columns(df)
-    df["country_id"], df["ISO_Alpha"] = zip(*df["country_code"].apply(get_country_info))
-    df['price_type'] = df.price_range.apply(create_price_type)
-    df['rating_color'] = df.rating_color.apply(color_name)
-    df.cuisines = df.loc[:, "cuisines"].astype(str).apply(lambda x: x.split(",")[0])
-    df = df.drop_duplicates()
-    df = df.drop(df[df.average_cost_for_two > 400000].index)
-    df = df.reset_index(drop=True)
-    return df
-
-
 def overview_map(df):
     country_list = df.country_id.unique().tolist()
+    zoom = 1.5
 
     # Create a Folium Map object
     map = folium.Map(location=[df.latitude.mean(),
                                df.longitude.mean()],
-                     zoom_start=1.5
+                     zoom_start=zoom
                      )
 
-    # Create a Geocoder object from Geopy
-    geolocator = Nominatim(user_agent="my_app")
-
-    # Loop to get the coordinates of each country and add markers to the map
-    for country in country_list:
-        location = geolocator.geocode(country)
-        latitude = location.latitude
-        longitude = location.longitude
-
-        # Add a marker for each country
-        folium.Marker(location=[latitude, longitude], popup=country).add_to(map)
+    # Coordinates come from the bundled centroids / geocode cache, any
+    # country not found there yet is geocoded in the background
+    locations = resolve_many(country_list)
 
-    # Load the country contours file
-    world_shapes = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
+    # Add a marker for each country
+    for country, location in locations.items():
+        if location is None:
+            continue
+        folium.Marker(location=list(location), popup=country).add_to(map)
 
-    # Filter the contours of the countries in the list
-    filtered_shapes = world_shapes[world_shapes['name'].isin(country_list)]
+    # Simplified country outlines, loaded once per process and joined on
+    # the ISO code (see dishy/shapes.py)
+    shapes = country_layer(df.ISO_Alpha.unique().tolist(), zoom=zoom)
 
     # Add the country outlines to the map
-    folium.GeoJson(filtered_shapes, style_function=style_function).add_to(map)
+    folium.GeoJson(shapes, style_function=style_function).add_to(map)
 
     # Show map
-    folium_static(map, width=1024, height=600)
+    with stage('folium_render', rows_in=len(df)):
+        folium_static(map, width=1024, height=600)
 
     return None
 
 
-def bar_plot_per_country(df, column, new_column_name, op):
-    cols = ['country_id', column]
-    aux = (df[cols].groupby('country_id')
-                   .agg(op)
-                   .sort_values(by=column, ascending=False)
-                   .rename(columns={column:new_column_name})
-                   .reset_index()
-                   )
-    fig = px.bar(aux, x='country_id', y=new_column_name,
-                 text_auto='.2s', color=new_column_name,
-                 color_continuous_scale='teal',
-                 labels={'country_id':'Country'}
-                 )
-    return fig
-
-
-
-def horizontal_bar_plot(df, column, result):
-    sum_column = (df.loc[:,['country_id', column]]
-                     .groupby('country_id')
-                     .sum()
-                     .reset_index()
-                     )
-    n_restaurants = (df.loc[:,['country_id', 'restaurant_id']]
-                       .groupby('country_id')
-                       .nunique()
-                       .rename(columns={'restaurant_id':'n_restaurant'})
-                       .reset_index()
-                       )
-    aux = pd.merge(sum_column, n_restaurants, on='country_id')
-    aux[result] = aux[column] / aux['n_restaurant']
-    aux = aux.sort_values(by=result)
-    fig = px.bar(aux, y='country_id', x=result,
-                 text_auto='.2s', color=result,
-                 color_continuous_scale='teal')
-    return fig
-
-
-
-def sunburst_plot(df):
-    aux = (df.loc[:, ['country_id', 'price_type', 'restaurant_id']]
-              .groupby(['country_id', 'price_type'])
-              .count()
-              .rename(columns={'restaurant_id':'n_restaurant'})
-          )
-    aux = aux.reset_index()
-    fig = px.sunburst(aux, 
-                      path=['country_id', 'price_type'],
-                      values='n_restaurant'
-                     )
-    fig.update_layout(height=700)
-    return fig
+def country_metrics(df, state):
+    # Every per-country metric of the page, aggregated in one pass
+    def aggregate():
+        aux = cube_metrics(df, state, ['country_id'])
+        return aux.reset_index()
+    return cached_aggregate(state, 'country_metrics', aggregate)
+
+
+
+def bar_plot_per_country(metrics, column, new_column_name):
+    aux = (metrics.loc[:, ['country_id', column]]
+                  .sort_values(by=column, ascending=False)
+                  .rename(columns={column:new_column_name})
+                  )
+    def build():
+        return px.bar(aux, x='country_id', y=new_column_name,
+                      text_auto='.2s', color=new_column_name,
+                      color_continuous_scale='teal',
+                      labels={'country_id':'Country'}
+                      )
+    return cached_figure('bar_plot_per_country', aux, build, y=new_column_name)
+
+
+
+def horizontal_bar_plot(metrics, column, result):
+    aux = (metrics.loc[:, ['country_id', column]]
+                  .sort_values(by=column)
+                  .rename(columns={column:result})
+                  )
+    def build():
+        return px.bar(aux, y='country_id', x=result,
+                      text_auto='.2s', color=result,
+                      color_continuous_scale='teal')
+    return cached_figure('horizontal_bar_plot', aux, build, x=result)
+
+
+
+def sunburst_plot(df, state):
+    def aggregate():
+        aux = (cube_aggregate(df, state, ['country_id', 'price_type'], 'restaurant_id', 'count')
+                  .rename(columns={'restaurant_id':'n_restaurant'})
+              )
+        return uncategorize(aux.reset_index())
+    aux = cached_aggregate(state, 'sunburst_plot', aggregate)
+    def build():
+        fig = px.sunburst(aux, 
+                          path=['country_id', 'price_type'],
+                          values='n_restaurant'
+                         )
+        fig.update_layout(height=700)
+        return fig
+    return cached_figure('sunburst_plot', aux, build)
 
 
 
@@ -218,15 +131,16 @@ st.set_page_config(page_title='Countries',
                    layout='wide'
                   )
 
-# -----------------
-# Import Dataset
-# -----------------
-zomato = pd.read_csv('dataset/zomato.csv')
+# Stage timings of this rerun, see dishy/trace.py
+begin_run('Countries')
 
 # -----------------
-# Cleaning Dataset
+# Import Dataset
 # -----------------
-df = clean_code(zomato)
+# Loaded and cleaned once per process, see dishy/data.py
+with stage('load_dataset') as span:
+    df = load_dataset()
+    span.rows_out = len(df)
 
 
 
@@ -255,7 +169,8 @@ price_options = st.sidebar.multiselect('Select the price type:',
 st.sidebar.markdown('''___''')
 rating_options = st.sidebar.slider('Select a range of ratings:',
                                    float(df.aggregate_rating.min()), float(df.aggregate_rating.max()), 
-                                   (float(df.aggregate_rating.min()), float(df.aggregate_rating.max()))
+                                   (float(df.aggregate_rating.min()), float(df.aggregate_rating.max())),
+                                   step=RATING_STEP
                                    )
 
 st.sidebar.markdown('''___''')
@@ -263,17 +178,8 @@ st.sidebar.markdown('##### Powered by Comunidade DS')
 st.sidebar.markdown('##### Data Analyst: Daniel Gomes')
 
 
-# country filter
-rows = df.country_id.isin(country_options)
-df = df.loc[rows,:]
-
-# price filter
-rows = df.price_type.isin(price_options)
-df = df.loc[rows,:]
-
-# rating filter
-rows = (df['aggregate_rating'] >= rating_options[0]) & (df['aggregate_rating'] <= rating_options[1])
-df = df.loc[rows,:]
+# country, price and rating filters, resolved on the bitmap index
+df, state = apply_filters(df, country_options, price_options, rating_options)
 
 
 
@@ -283,29 +189,31 @@ df = df.loc[rows,:]
 # #########################
 st.title("Countries")
 
+metrics = country_metrics(df, state)
+
 with st.container():
 # Order Metric
     st.markdown("<h3 style='text-align: center; color: #129fa5;'>Number of registered cities per country</h2>",
                 unsafe_allow_html=True)
-    fig = bar_plot_per_country(df, 'city', '#_cities', 'nunique')
+    fig = bar_plot_per_country(metrics, 'n_cities', '#_cities')
     st.plotly_chart(fig, use_container_width=True)
 
 with st.container():
     st.markdown("<h3 style='text-align: center; color: #129fa5;'>Number of registered restaurants per country</h2>",
                 unsafe_allow_html=True)
-    fig = bar_plot_per_country(df, 'restaurant_id', '#_restaurant', 'nunique')
+    fig = bar_plot_per_country(metrics, 'n_restaurant', '#_restaurant')
     st.plotly_chart(fig, use_container_width=True)
     
 with st.container():
     st.markdown("<h3 style='text-align: center; color: #129fa5;'>Number of cuisines per country</h2>",
                 unsafe_allow_html=True)
-    fig = bar_plot_per_country(df, 'cuisines', '#_cuisines', 'nunique')
+    fig = bar_plot_per_country(metrics, 'n_cuisines', '#_cuisines')
     st.plotly_chart(fig, use_container_width=True)
     
 with st.container():
     st.markdown("<h3 style='text-align: center; color: #129fa5;'>Number of evaluations per country</h2>",
                 unsafe_allow_html=True)
-    fig = bar_plot_per_country(df, 'votes', '#_votes', 'sum')
+    fig = bar_plot_per_country(metrics, 'votes', '#_votes')
     st.plotly_chart(fig, use_container_width=True)
     
 with st.container():
@@ -313,17 +221,20 @@ with st.container():
     with col1:
         st.markdown("<h3 style='text-align: center; color: #129fa5;'>Avg Number of reviews per country</h2>",
                 unsafe_allow_html=True)
-        fig = horizontal_bar_plot(df, 'votes', 'reviews_per_rest')
+        fig = horizontal_bar_plot(metrics, 'votes_per_restaurant', 'reviews_per_rest')
         st.plotly_chart(fig, use_container_width=True)
         
     with col2:
         st.markdown("<h3 style='text-align: center; color: #129fa5;'>Avg score per country</h2>",
                 unsafe_allow_html=True)
-        fig = horizontal_bar_plot(df, 'aggregate_rating', 'avg_score')
+        fig = horizontal_bar_plot(metrics, 'rating_per_restaurant', 'avg_score')
         st.plotly_chart(fig, use_container_width=True)
         
 with st.container():
     st.markdown("<h3 style='text-align: center; color: #129fa5;'>Countries & Price types</h2>",
                 unsafe_allow_html=True)
-    fig = sunburst_plot(df)
+    fig = sunburst_plot(df, state)
     st.plotly_chart(fig, use_container_width=True)
+
+
+performance_panel()
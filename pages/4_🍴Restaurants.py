@@ -2,177 +2,64 @@
 # Import libraries
 # ========================================
 # import hvplot.pandas
-import folium
-import inflection
 import pandas         as pd
-import geopandas      as gpd
-import plotly.express as px
 import streamlit      as st
-import requests
 
-from streamlit_folium import folium_static
-from geopy.geocoders  import Nominatim
-from PIL              import Image
+from dishy.aggregates import cached_aggregate
+from dishy.cleaning   import uncategorize
+from dishy.cube       import RATING_STEP, cube_aggregate
+from dishy.data       import load_dataset
+from dishy.figures    import cached_figure
+from dishy.filters    import apply_filters
+from dishy.lazy       import lazy_import
+from dishy.scatter    import MAX_SCATTER_POINTS, SCATTER_MODE, rating_cost_figure
+from dishy.topk       import top_k, top_n_per_group
+from dishy.trace      import begin_run, performance_panel, stage
+
+# Heavy dependencies are imported when first used, see dishy/lazy.py
+px    = lazy_import('plotly.express')
+Image = lazy_import('PIL.Image')
 
 
 # ==========================================================
 #                       Functions
 # ==========================================================
 
-def rename_columns(dataframe):
-    df = dataframe.copy()
-    title      = lambda x: inflection.titleize(x)
-    snakecase  = lambda x: inflection.underscore(x)
-    spaces     = lambda x: x.replace(" ", "")
-    cols_old   = list(df.columns)
-    cols_old   = list(map(title, cols_old))
-    cols_old   = list(map(spaces, cols_old))
-    cols_new   = list(map(snakecase, cols_old))
-    df.columns = cols_new
-    return df
-
-
-COUNTRIES_ISO = {
-    1:  {"country_id": "India",                     "iso_alpha": "IND"},
-    14: {"country_id": "Australia",                 "iso_alpha": "AUS"},
-    30: {"country_id": "Brazil",                    "iso_alpha": "BRA"},
-    37: {"country_id": "Canada",                    "iso_alpha": "CAN"},
-    94: {"country_id": "Indonesia",                 "iso_alpha": "IDN"},
-    148: {"country_id": "New Zealand",              "iso_alpha": "NZL"},
-    162: {"country_id": "Philippines",              "iso_alpha": "PHL"},
-    166: {"country_id": "Qatar",                    "iso_alpha": "QAT"},
-    184: {"country_id": "Singapore",                "iso_alpha": "SGP"},
-    189: {"country_id": "South Africa",             "iso_alpha": "ZAF"},
-    191: {"country_id": "Sri Lanka",                "iso_alpha": "LKA"},
-    208: {"country_id": "Turkey",                   "iso_alpha": "TUR"},
-    214: {"country_id": "United Arab Emirates",     "iso_alpha": "ARE"},
-    215: {"country_id": "United Kingdom",           "iso_alpha": "GBR"},
-    216: {"country_id": "United States of America", "iso_alpha": "USA"},
-}
-def get_country_info(country_id):
-    country_info = COUNTRIES_ISO.get(country_id)
-    return country_info["country_id"], country_info["iso_alpha"]
-
-
-def create_price_type(price_range):
-    if price_range == 1:
-        return "cheap"
-    elif price_range == 2:
-        return "normal"
-    elif price_range == 3:
-        return "expensive"
-    else:
-        return "gourmet"
-
-
-COLORS = {
-    "3F7E00": "darkgreen",
-    "5BA829": "green",
-    "9ACD32": "lightgreen",
-    "CDD614": "pear",
-    "FFBA00": "darkyellow",
-    "CBCBC8": "silver",
-    "FF7800": "orange",
-    }
-def color_name(color_code):
-    return COLORS[color_code]
-
-
-
-currency_mapping = {
-    "Botswana Pula(P)":       "BWP",
-    "Brazilian Real(R$)":     "BRL",
-    "Dollar($)":              "USD",
-    "Emirati Diram(AED)":     "AED",
-    "Indian Rupees(Rs.)":     "INR",
-    "Indonesian Rupiah(IDR)": "IDR",
-    "NewZealand($)":          "NZD",
-    "Pounds(£)":              "GBP",
-    "Qatari Rial(QR)":        "QAR",
-    "Rand(R)":                "ZAR",
-    "Sri Lankan Rupee(LKR)":  "LKR",
-    "Turkish Lira(TL)":       "TRY"
-}
-def convert_to_usd(df, currency_column, currency_mapping):
-    url = 'https://api.exchangerate-api.com/v4/latest/USD'
-    response = requests.get(url)
-    if response.status_code == 200:
-        rates = response.json()['rates']
-        df_rates = pd.DataFrame(rates.items(), columns=['Currency', 'Rate'])
-        df_rates.set_index('Currency', inplace=True)
-        df['average_cost_for_two_USD'] = df.apply(lambda x: x['average_cost_for_two'] / df_rates.loc[currency_mapping[x[currency_column]], 'Rate'], axis=1)
-    else:
-        print('Error', response.status_code)
-    
-    
-
-def count_unique_values(df):
-    unique_counts = df.nunique().reset_index()
-    unique_counts.columns = ['Column', 'Unique Count']
-    return unique_counts
-
-
-def drop_single_value_columns(df):
-    unique_counts = count_unique_values(df)
-    single_value_columns = unique_counts[unique_counts['Unique Count'] == 1]['Column']
-    return df.drop(single_value_columns, axis=1)
-
-
-def check_nulls(df):
-    nulls_per_column = df.isnull().sum()
-    total_values_per_column = df.shape[0]
-    percent_null_per_column = (nulls_per_column / total_values_per_column) * 100
-    return pd.DataFrame({'Column': nulls_per_column.index,
-                         'Percent_nulls': percent_null_per_column.values})
-
-
-def clean_code(df):
-    df = drop_single_value_columns(df)
-    df = rename_columns(df)
-    df["country_id"], df["ISO_Alpha"] = zip(*df["country_code"].apply(get_country_info))
-    df['price_type'] = df.price_range.apply(create_price_type)
-    df['rating_color'] = df.rating_color.apply(color_name)
-    df['restaurant_id'] = df['restaurant_id'].astype(str)
-    convert_to_usd(df, 'currency', currency_mapping)
-    df.cuisines = df.loc[:, "cuisines"].astype(str).apply(lambda x: x.split(",")[0])
-    df = df.drop_duplicates()
-    df = df.drop(df[df.average_cost_for_two > 400000].index)
-    df = df.reset_index(drop=True)
-    return df
-
-
-
-def bar_plot(df, col_x, new_col_x_name, col_y, new_col_y_name, op):
-    cols = [col_x, col_y]
-    aux = (df[cols].groupby(col_x)
-                   .agg(op)
-                   .sort_values(by=col_y, ascending=False)
-                   .reset_index()
-                   .rename(columns={col_x:new_col_x_name,
-                                    col_y:new_col_y_name})
-                   )
-    fig = px.bar(aux.head(15), x=col_x, y=new_col_y_name,
-                 text_auto='.2s', color=new_col_x_name,
-                 color_continuous_scale='teal',
-                 # labels={'country_id':'Country'}
-                 )
-    fig.update_layout(xaxis={'categoryorder': 'array',
-                             'categoryarray': aux[col_x].head(15)},
+def bar_plot(df, state, col_x, new_col_x_name, col_y, new_col_y_name, op, n=15):
+    def aggregate():
+        aux = (top_k(cube_aggregate(df, state, [col_x], col_y, op), col_y, n)
+                       .reset_index()
+                       .rename(columns={col_x:new_col_x_name,
+                                        col_y:new_col_y_name})
+                       )
+        return uncategorize(aux)
+    aux = cached_aggregate(state, ('bar_plot', col_x, new_col_x_name, col_y, new_col_y_name, op, n), aggregate)
+    def build():
+        fig = px.bar(aux, x=col_x, y=new_col_y_name,
+                     text_auto='.2s', color=new_col_x_name,
+                     color_continuous_scale='teal',
+                     # labels={'country_id':'Country'}
                      )
-    return fig
+        fig.update_layout(xaxis={'categoryorder': 'array',
+                                 'categoryarray': aux[col_x]},
+                         )
+        return fig
+    return cached_figure('bar_plot', aux, build, x=col_x, y=new_col_y_name, color=new_col_x_name)
 
 
 def avg_per_country(df, column):
     sum_reviews = (df.loc[:,['country_id', column]]
-                     .groupby('country_id')
+                     .groupby('country_id', observed=True)
                      .sum()
+                     .sort_index()
                      .sort_values(by=column, ascending=False)
                      .reset_index()
                      )
 
     n_restaurants = (df.loc[:,['country_id', 'restaurant_id']]
-                       .groupby('country_id')
+                       .groupby('country_id', observed=True)
                        .nunique()
+                       .sort_index()
                        .sort_values(by='restaurant_id', ascending=False)
                        .rename(columns={'restaurant_id':'n_restaurant'})
                        .reset_index()
@@ -193,31 +80,42 @@ def avg_per_country(df, column):
 
 
 
-def scatter_plot(df):
-    fig = px.scatter(df, y='aggregate_rating', x='average_cost_for_two_USD',
-                     color='cuisines',
-                     hover_data=["city", "country_id"],
-                     hover_name='restaurant_name',
-                     size_max=30)
-    return fig
+def scatter_plot(df, state):
+    # WebGL points; density bins or a stratified sample on large selections
+    def build():
+        return rating_cost_figure(df, MAX_SCATTER_POINTS, SCATTER_MODE)
+    return cached_figure('scatter_plot', df, build, state, max_points=MAX_SCATTER_POINTS, mode=SCATTER_MODE)
 
 
 
-def table_top_15(df):
-    aux = (df.sort_values(by=['aggregate_rating', 'votes'],
-                         ascending=[False, False])
-             .loc[:,['restaurant_id', 'restaurant_name', 'country_id', 'city', 'cuisines', 'average_cost_for_two_USD', 'price_type', 'aggregate_rating', 'votes']]
-          )
-    return aux.head(15)
+def table_top_15(df, state):
+    def aggregate():
+        return (top_k(df, ['aggregate_rating', 'votes'], 15)
+                  .loc[:,['restaurant_id', 'restaurant_name', 'country_id', 'city', 'cuisines', 'average_cost_for_two_USD', 'price_type', 'aggregate_rating', 'votes']]
+               )
+    return cached_aggregate(state, 'table_top_15', aggregate)
 
 
 
-def treemap_plot(df):
-    fig = px.treemap(df, path=[px.Constant('all'), 'country_id', 'cuisines'],
-                    color_continuous_scale='Blues', title='Restaurant Distribution')
-    fig.update_layout(margin = dict(t=20, l=10, r=10, b=10),
-                      height=600)
-    return fig
+def treemap_plot(df, state, n=15):
+    # Restaurants per country x cuisine from the data cube; past the n
+    # largest cuisines of a country the rest is one 'Other cuisines' tile
+    def aggregate():
+        aux = (cube_aggregate(df, state, ['country_id', 'cuisines'], 'restaurant_id', 'count')
+                  .rename(columns={'restaurant_id':'n_restaurant'})
+                  .reset_index()
+              )
+        return top_n_per_group(uncategorize(aux), 'country_id', 'cuisines', 'n_restaurant', n,
+                               other='Other cuisines')
+    aux = cached_aggregate(state, ('treemap_plot', n), aggregate)
+    def build():
+        fig = px.treemap(aux, path=[px.Constant('all'), 'country_id', 'cuisines'],
+                        values='n_restaurant',
+                        color_continuous_scale='Blues', title='Restaurant Distribution')
+        fig.update_layout(margin = dict(t=20, l=10, r=10, b=10),
+                          height=600)
+        return fig
+    return cached_figure('treemap_plot', aux, build)
 # ----------------- Start of the logical code structure -----------------
 
 st.set_page_config(page_title='Countries',
@@ -225,15 +123,16 @@ st.set_page_config(page_title='Countries',
                    layout='wide'
                   )
 
-# -----------------
-# Import Dataset
-# -----------------
-zomato = pd.read_csv('dataset/zomato.csv')
+# Stage timings of this rerun, see dishy/trace.py
+begin_run('Restaurants')
 
 # -----------------
-# Cleaning Dataset
+# Import Dataset
 # -----------------
-df = clean_code(zomato)
+# Loaded and cleaned once per process, see dishy/data.py
+with stage('load_dataset') as span:
+    df = load_dataset()
+    span.rows_out = len(df)
 
 
 
@@ -274,7 +173,8 @@ price_options = st.sidebar.multiselect('Select the price type:',
 st.sidebar.markdown('''___''')
 rating_options = st.sidebar.slider('Select a range of ratings:',
                                    float(df.aggregate_rating.min()), float(df.aggregate_rating.max()), 
-                                   (float(df.aggregate_rating.min()), float(df.aggregate_rating.max()))
+                                   (float(df.aggregate_rating.min()), float(df.aggregate_rating.max())),
+                                   step=RATING_STEP
                                    )
 
 st.sidebar.markdown('''___''')
@@ -282,17 +182,8 @@ st.sidebar.markdown('##### Powered by Comunidade DS')
 st.sidebar.markdown('##### Data Analyst: Daniel Gomes')
 
 
-# country filter
-rows = df.country_id.isin(country_options)
-df = df.loc[rows,:]
-
-# price filter
-rows = df.price_type.isin(price_options)
-df = df.loc[rows,:]
-
-# rating filter
-rows = (df['aggregate_rating'] >= rating_options[0]) & (df['aggregate_rating'] <= rating_options[1])
-df = df.loc[rows,:]
+# country, price and rating filters, resolved on the bitmap index
+df, state = apply_filters(df, country_options, price_options, rating_options)
 
 
 # #########################
@@ -322,25 +213,27 @@ with st.container():
 # Order Metric
     st.markdown("<h3 style='text-align: center; color: #129fa5;'>Average cost for two per Ratings</h2>",
                 unsafe_allow_html=True)
-    fig = scatter_plot(df)
+    fig = scatter_plot(df, state)
     st.plotly_chart(fig, use_container_width=True)
 
 with st.container():
     st.markdown("<h3 style='text-align: center; color: #129fa5;'>Top 15 Restaurants (by ratings & votes)</h2>",
                 unsafe_allow_html=True)
-    aux = table_top_15(df)
+    aux = table_top_15(df, state)
     st.dataframe(aux)
     
 with st.container():
     st.markdown("<h3 style='text-align: center; color: #129fa5;'>Average cost for two (US$) by cuisines</h2>",
                 unsafe_allow_html=True)
-    fig = bar_plot(df, 'cuisines', 'cuisines', 'average_cost_for_two_USD', 'US$', 'mean')
+    fig = bar_plot(df, state, 'cuisines', 'cuisines', 'average_cost_for_two_USD', 'US$', 'mean')
     # fig = bar_plot_per_country(df, 'cuisines', '#_cuisines', 'mean')
     st.plotly_chart(fig, use_container_width=True)
     
 with st.container():
     st.markdown("<h3 style='text-align: center; color: #129fa5;'>Cuisines diversity</h2>",
                 unsafe_allow_html=True)
-    fig = treemap_plot(df)
+    fig = treemap_plot(df, state)
     st.plotly_chart(fig, use_container_width=True)
-       
+
+
+performance_panel()
@@ -0,0 +1,13 @@
+# ========================================
+# Import libraries
+# ========================================
+import os
+import sys
+
+
+# The tests run from a checkout: import dishy from it, and never reach the
+# network for exchange rates.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault('DISHY_FX_OFFLINE', '1')
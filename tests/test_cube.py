@@ -0,0 +1,50 @@
+# ========================================
+# Import libraries
+# ========================================
+import pytest
+
+from dishy            import cube as cube_module
+from dishy.cube       import DataCube, cached_data_cube, cube_selection
+from dishy.data       import clear_cache, load_dataset
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    clear_cache()
+    yield load_dataset()
+    clear_cache()
+
+
+def expected_restaurants(df, by):
+    result = df.groupby(by, observed=True)['restaurant_id'].nunique()
+    return result.sort_index().tolist()
+
+
+@pytest.mark.parametrize('by', [['country_id'], ['country_id', 'city'], ['cuisines']])
+def test_distinct_restaurants_exact(dataset, by):
+    cube = DataCube(dataset)
+    assert cube.exact
+    counts = cube.aggregate(by, 'restaurant_id', 'nunique')['restaurant_id']
+    assert counts.tolist() == expected_restaurants(dataset, by)
+    assert cube.metrics(by)['n_restaurant'].tolist() == expected_restaurants(dataset, by)
+
+
+def test_merged_chunks_match_whole_table(dataset):
+    cube   = DataCube(dataset)
+    merged = DataCube(dataset.iloc[:3000]).merge(DataCube(dataset.iloc[3000:]))
+    assert merged.metrics(['country_id']).equals(cube.metrics(['country_id']))
+
+
+def test_large_cubes_fall_back_to_hll(dataset):
+    cube = DataCube(dataset, max_exact_pairs=100)
+    assert not cube.exact
+    counts   = cube.aggregate(['country_id'], 'restaurant_id', 'nunique')['restaurant_id'].tolist()
+    expected = expected_restaurants(dataset, ['country_id'])
+    assert all(abs(got - want) <= max(3, 0.1 * want) for got, want in zip(counts, expected))
+
+
+def test_stale_selection_is_not_cached_under_its_version(dataset, monkeypatch):
+    monkeypatch.setattr(cube_module, '_cubes', {})
+    cube, selection = cube_selection(dataset.iloc[:100], ('refreshed away', ((), (), None)))
+    assert selection is None and cube.cells['n_rows'].sum() == 100
+    assert cached_data_cube('refreshed away') is None
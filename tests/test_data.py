@@ -0,0 +1,52 @@
+# ========================================
+# Import libraries
+# ========================================
+import numpy          as np
+import pytest
+
+from dishy.data       import clear_cache, load_dataset
+from dishy.fx         import RateCache, StaticRateProvider, get_rate_cache, set_rate_cache
+
+
+@pytest.fixture
+def dataset():
+    clear_cache()
+    yield load_dataset()
+    clear_cache()
+
+
+# Every kind of column compact() produces: int16, float32, bool, categorical
+@pytest.mark.parametrize('column', ['votes', 'aggregate_rating', 'is_delivering_now', 'city'])
+def test_view_writes_raise(dataset, column):
+    position = dataset.columns.get_loc(column)
+    with pytest.raises(ValueError, match='read-only'):
+        dataset.iloc[0, position] = dataset.iloc[1, position]
+    values = dataset[column].to_numpy() if column != 'city' else dataset[column].cat.codes.to_numpy()
+    with pytest.raises(ValueError, match='read-only'):
+        values[0] = values[1]
+
+
+def test_cached_table_unchanged_after_failed_write(dataset):
+    before = load_dataset()['votes'].to_numpy().copy()
+    with pytest.raises(ValueError):
+        dataset['votes'].to_numpy()[1] = 12345
+    assert np.array_equal(load_dataset()['votes'].to_numpy(), before)
+
+
+def test_new_rates_reach_the_cached_table(dataset):
+    cache = get_rate_cache()
+    rates = cache.rates()
+    doubled = dict(rates, INR=rates['INR'] * 2)
+    try:
+        set_rate_cache(RateCache(remote=StaticRateProvider(doubled), snapshot=cache.snapshot))
+        before = load_dataset()
+        assert get_rate_cache().refresh()
+        after  = load_dataset()
+    finally:
+        set_rate_cache(cache)
+    assert after.attrs['version'] != before.attrs['version']
+    india = (before['currency'] == 'Indian Rupees(Rs.)').to_numpy()
+    assert np.allclose(after['average_cost_for_two_USD'].to_numpy()[india],
+                       before['average_cost_for_two_USD'].to_numpy()[india] / 2)
+    assert np.array_equal(after['average_cost_for_two_USD'].to_numpy()[~india],
+                          before['average_cost_for_two_USD'].to_numpy()[~india], equal_nan=True)
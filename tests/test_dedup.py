@@ -0,0 +1,61 @@
+# ========================================
+# Import libraries
+# ========================================
+import numpy          as np
+import pandas         as pd
+import pytest
+
+from dishy.cleaning   import rename_columns, transform_columns
+from dishy.data       import DATASET_PATH
+from dishy.dedup      import SeenRows, drop_duplicate_rows
+from dishy.fx         import get_rates
+from dishy.ingest     import clean_chunks
+
+
+# Exact duplicate rows of the bundled export
+DUPLICATES = 585
+
+
+@pytest.fixture(scope='module')
+def rates():
+    return get_rates()
+
+
+@pytest.fixture(scope='module')
+def transformed(rates):
+    return transform_columns(rename_columns(pd.read_csv(DATASET_PATH)), rates)
+
+
+def comparable(df):
+    return df.astype({column: object for column in df.select_dtypes('category').columns})
+
+
+def test_drop_duplicate_rows_matches_pandas(transformed):
+    kept, n_dropped = drop_duplicate_rows(transformed)
+    assert n_dropped == DUPLICATES
+    pd.testing.assert_frame_equal(kept, transformed.drop_duplicates())
+
+
+def test_drop_duplicate_rows_without_key():
+    rng = np.random.default_rng(0)
+    df  = pd.DataFrame({'a': rng.integers(0, 5, 500), 'b': rng.choice(['x', 'y'], 500)})
+    kept, n_dropped = drop_duplicate_rows(df, key=None)
+    pd.testing.assert_frame_equal(kept, df.drop_duplicates())
+    assert n_dropped == len(df) - len(kept)
+
+
+@pytest.mark.parametrize('chunk_size', [500, 2_000])
+def test_streaming_dedup_matches_whole_file(transformed, rates, chunk_size):
+    seen  = SeenRows()
+    kept  = pd.concat([comparable(seen.drop_duplicates(transform_columns(rename_columns(chunk), rates)))
+                       for chunk in pd.read_csv(DATASET_PATH, chunksize=chunk_size)])
+    whole = comparable(drop_duplicate_rows(transformed)[0])
+    assert seen.dropped == DUPLICATES
+    pd.testing.assert_frame_equal(kept, whole)
+
+
+def test_clean_chunks_count_duplicates_across_chunks(rates):
+    stats = {}
+    for _ in clean_chunks(DATASET_PATH, 500, stats, rates):
+        pass
+    assert stats['duplicates'] == DUPLICATES
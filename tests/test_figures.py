@@ -0,0 +1,25 @@
+# ========================================
+# Import libraries
+# ========================================
+import pandas         as pd
+
+from dishy            import figures
+
+
+def build(df):
+    return df
+
+
+def test_figure_key_is_namespaced(monkeypatch):
+    data = pd.DataFrame({'a': [1, 2]})
+    key  = figures.figure_key('bars', build, data, {})
+    assert figures.figure_key('bars', build, data, {}) == key
+
+    monkeypatch.setattr(figures, '_namespaces', {})
+    monkeypatch.setattr(figures, 'FIGURE_CACHE_VERSION', figures.FIGURE_CACHE_VERSION + 1)
+    assert figures.figure_key('bars', build, data, {}) != key
+
+    monkeypatch.setattr(figures, '_namespaces', {})
+    monkeypatch.setattr(figures, 'FIGURE_CACHE_VERSION', figures.FIGURE_CACHE_VERSION - 1)
+    monkeypatch.setattr(figures.metadata, 'version', lambda name: 'another')
+    assert figures.figure_key('bars', build, data, {}) != key
@@ -0,0 +1,57 @@
+# ========================================
+# Import libraries
+# ========================================
+import numpy          as np
+import pandas         as pd
+import pytest
+
+from dishy.aggregates import normalize_filters
+from dishy.data       import clear_cache, load_dataset
+from dishy.filters    import apply_filters
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    clear_cache()
+    yield load_dataset()
+    clear_cache()
+
+
+def masked(df, countries, price_types, rating_range):
+    # The boolean masks apply_filters replaces
+    mask = (df['country_id'].isin(countries)
+            & df['price_type'].isin(price_types)
+            & (df['aggregate_rating'] >= rating_range[0])
+            & (df['aggregate_rating'] <= rating_range[1]))
+    return df[mask]
+
+
+def random_selections(df, n, seed=0):
+    rng         = np.random.default_rng(seed)
+    countries   = df['country_id'].unique().tolist()
+    price_types = df['price_type'].unique().tolist()
+    ratings     = df['aggregate_rating'].unique()
+    for _ in range(n):
+        # Rating bounds both on float32 values of the column and between them
+        low, high = sorted(rng.choice(ratings, 2).astype(float) + rng.choice([0, 0.05], 2))
+        yield (list(rng.choice(countries, rng.integers(0, len(countries) + 1), replace=False)),
+               list(rng.choice(price_types, rng.integers(0, len(price_types) + 1), replace=False)),
+               (low, high))
+
+
+def test_apply_filters_matches_boolean_masks(dataset):
+    for selection in random_selections(dataset, 50):
+        filtered, state = apply_filters(dataset, *selection)
+        pd.testing.assert_frame_equal(filtered, masked(dataset, *selection))
+        assert state == (dataset.attrs['version'], normalize_filters(*selection))
+
+
+@pytest.mark.parametrize('selection', [
+    ([], ['cheap'], (0.0, 5.0)),
+    (['India'], [], (0.0, 5.0)),
+    (['India'], ['cheap'], (4.95, 4.96)),
+    (['India', 'Brazil'], ['cheap', 'expensive'], (3.7, 3.7)),
+])
+def test_empty_and_single_value_selections(dataset, selection):
+    filtered, _ = apply_filters(dataset, *selection)
+    pd.testing.assert_frame_equal(filtered, masked(dataset, *selection))
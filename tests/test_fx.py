@@ -0,0 +1,64 @@
+# ========================================
+# Import libraries
+# ========================================
+import json
+import time
+
+import pytest
+
+from dishy.fx         import HttpRateProvider, RateCache, SnapshotRateProvider, serve_stub_rates
+
+
+BUNDLED = {'USD': 1.0, 'INR': 80.0}
+FETCHED = {'USD': 1.0, 'INR': 83.0}
+
+
+@pytest.fixture
+def stub():
+    server, url = serve_stub_rates(FETCHED)
+    yield url
+    server.shutdown()
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = tmp_path / 'usd_rates.json'
+    path.write_text(json.dumps({'base': 'USD', 'fetched_at': 1, 'rates': BUNDLED}))
+    return SnapshotRateProvider(str(path), str(tmp_path / 'usd_rates.cache.json'))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_http_provider_reads_stub(stub):
+    assert HttpRateProvider(stub).fetch() == FETCHED
+
+
+def test_stale_snapshot_refreshes_in_background(stub, snapshot):
+    cache = RateCache(remote=HttpRateProvider(stub), snapshot=snapshot)
+    # The old bundled snapshot is served at once, the refresh follows
+    assert cache.rates() == BUNDLED
+    assert wait_for(lambda: cache.rates() == FETCHED)
+
+
+def test_fetched_rates_never_overwrite_bundled_snapshot(stub, snapshot):
+    bundled = open(snapshot.path).read()
+    assert RateCache(remote=HttpRateProvider(stub), snapshot=snapshot).refresh()
+    assert open(snapshot.path).read() == bundled
+    with open(snapshot.cache_path) as f:
+        assert json.load(f)['rates'] == FETCHED
+    # A new process starts from the last fetched rates
+    assert RateCache(snapshot=SnapshotRateProvider(snapshot.path, snapshot.cache_path)).rates() == FETCHED
+
+
+def test_failed_fetch_keeps_current_rates(snapshot):
+    cache = RateCache(remote=HttpRateProvider('http://127.0.0.1:9/', timeout=0.5), snapshot=snapshot, ttl=1e12)
+    assert cache.rates() == BUNDLED
+    assert not cache.refresh()
+    assert cache.rates() == BUNDLED
@@ -0,0 +1,39 @@
+# ========================================
+# Import libraries
+# ========================================
+import pandas         as pd
+import pytest
+
+from dishy            import parallel
+from dishy.cleaning   import clean_code
+from dishy.data       import DATASET_PATH
+from dishy.fx         import get_rates
+from dishy.ingest     import ingest
+from dishy.parallel   import clean_parallel
+
+
+@pytest.fixture(scope='module')
+def rates():
+    return get_rates()
+
+
+@pytest.fixture(scope='module')
+def expected(rates):
+    return clean_code(pd.read_csv(DATASET_PATH), rates=rates)
+
+
+@pytest.mark.parametrize('chunk_size', [500, 100_000])
+def test_ingest_matches_clean_code(expected, rates, chunk_size):
+    df, cube, stats = ingest(DATASET_PATH, chunk_size, rates)
+    pd.testing.assert_frame_equal(df, expected)
+    assert stats['rows'] == len(expected)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_clean_parallel_matches_clean_code(expected, rates, workers, monkeypatch):
+    # Small partitions, so the bundled export is split across the workers
+    monkeypatch.setattr(parallel, 'MIN_PARTITION_ROWS', 1_000)
+    stats = {}
+    df = clean_parallel(pd.read_csv(DATASET_PATH), workers, stats, rates)
+    assert stats['workers'] == workers
+    pd.testing.assert_frame_equal(df, expected)
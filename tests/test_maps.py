@@ -0,0 +1,21 @@
+# ========================================
+# Import libraries
+# ========================================
+from dishy.maps       import leaflet_view
+
+
+INITIAL = {'zoom': 2, 'bounds': None}
+
+
+def leaflet_bounds(south, west, north, east):
+    return {'_southWest': {'lat': south, 'lng': west}, '_northEast': {'lat': north, 'lng': east}}
+
+
+def test_initial_output_is_not_a_new_view():
+    assert leaflet_view(None, INITIAL) is INITIAL
+    assert leaflet_view({'zoom': 2, 'bounds': leaflet_bounds(None, None, None, None)}, INITIAL) is INITIAL
+
+
+def test_pan_is_a_new_view():
+    output = {'zoom': 4, 'bounds': leaflet_bounds(-10, 20, 10, 40)}
+    assert leaflet_view(output, INITIAL) == {'zoom': 4, 'bounds': (-10, 20, 10, 40)}
@@ -0,0 +1,60 @@
+# ========================================
+# Import libraries
+# ========================================
+import shutil
+
+import numpy          as np
+import pandas         as pd
+import pytest
+
+from dishy.cleaning   import clean_code, rename_columns
+from dishy.data       import DATASET_PATH, file_hash
+from dishy.fx         import get_rates_with_version
+from dishy.refresh    import RowIndex, refresh_entry
+from dishy.snapshot   import build_snapshot, read_row_index
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / 'zomato.csv')
+    shutil.copy(DATASET_PATH, path)
+    return path
+
+
+def entry_for(path):
+    raw = pd.read_csv(path)
+    rates, rates_version = get_rates_with_version()
+    return {'hash': file_hash(path), 'rates': rates_version, 'version': 'before',
+            'df': clean_code(raw, rates=rates), 'rows': RowIndex(rename_columns(raw))}
+
+
+def comparable(df):
+    df = df.astype({column: object for column in df.select_dtypes('category').columns})
+    return df.sort_values(['restaurant_id', 'votes', 'address']).reset_index(drop=True)
+
+
+def test_refresh_matches_full_clean(csv_path):
+    entry = entry_for(csv_path)
+    raw   = pd.read_csv(csv_path)
+    # appended restaurants
+    appended = raw.sample(50, random_state=1).assign(**{'Restaurant ID': np.arange(10**9, 10**9 + 50)})
+    # changed rows
+    raw.loc[raw.sample(20, random_state=2).index, 'Votes'] += 7
+    # removed rows
+    raw = raw.drop(raw.sample(30, random_state=3).index)
+    pd.concat([raw, appended]).to_csv(csv_path, index=False)
+
+    refreshed = refresh_entry(csv_path, entry)
+    expected  = clean_code(pd.read_csv(csv_path))
+    assert refreshed['refresh']['rows_added'] >= 50
+    pd.testing.assert_frame_equal(comparable(refreshed['df']), comparable(expected), check_dtype=False)
+
+
+def test_snapshot_stores_row_index(csv_path):
+    pytest.importorskip('pyarrow')
+    metadata = build_snapshot(csv_path)
+    rows     = read_row_index(csv_path, metadata['source_hash'])
+    expected = RowIndex(rename_columns(pd.read_csv(csv_path)))
+    assert np.array_equal(rows.ids, expected.ids)
+    assert np.array_equal(rows.hashes, expected.hashes)
+    assert read_row_index(csv_path, 'another export') is None
@@ -0,0 +1,44 @@
+# ========================================
+# Import libraries
+# ========================================
+import numpy          as np
+import pandas         as pd
+import pytest
+
+from dishy            import scatter
+
+
+@pytest.fixture
+def restaurants():
+    rng  = np.random.default_rng(0)
+    cost = np.concatenate([rng.uniform(5, 50, 5_000), rng.uniform(500, 900, 300)])
+    return pd.DataFrame({
+        'average_cost_for_two_USD': cost,
+        'aggregate_rating':         np.round(rng.uniform(0, 5, len(cost)), 1).astype(np.float32),
+        'restaurant_name':          ['r{}'.format(i) for i in range(len(cost))],
+        'city':                     'city',
+        'country_id':               rng.choice(['India', 'Brazil'], len(cost)),
+    })
+
+
+def counted(fig):
+    return int(np.nansum(np.array(fig.data[0].z, dtype='float64'))) + len(fig.data[1].x)
+
+
+def test_capped_outliers_are_counted_in_overflow_bin(restaurants):
+    fence    = scatter.cost_fence(restaurants)
+    outliers = scatter.cost_outliers(restaurants, fence, max_outliers=20)
+    fig = scatter.density_figure(restaurants, outliers, fence)
+    assert counted(fig) == len(restaurants)
+    assert len(fig.data[0].x) == scatter.COST_BINS + 1
+    assert np.nansum(np.array(fig.data[0].z, dtype='float64')[:, -1]) == 280
+    assert 'top 20 of 300' in fig.data[1].name
+
+
+def test_no_overflow_bin_when_every_outlier_is_drawn(restaurants):
+    fence    = scatter.cost_fence(restaurants)
+    outliers = scatter.cost_outliers(restaurants, fence)
+    fig = scatter.density_figure(restaurants, outliers, fence)
+    assert counted(fig) == len(restaurants)
+    assert len(fig.data[0].x) == scatter.COST_BINS
+    assert fig.data[1].name == 'cost outliers'
@@ -0,0 +1,47 @@
+# ========================================
+# Import libraries
+# ========================================
+import shutil
+
+import numpy          as np
+import pandas         as pd
+import pytest
+
+from dishy            import snapshot
+from dishy.data       import DATASET_PATH
+
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def built(tmp_path):
+    path = str(tmp_path / 'zomato.csv')
+    shutil.copy(DATASET_PATH, path)
+    return path, snapshot.build_snapshot(path)
+
+
+def test_snapshot_round_trip(built):
+    path, metadata = built
+    df = snapshot.load_snapshot(path, metadata['source_hash'])
+    assert len(df) == metadata['rows']
+    assert snapshot.read_metadata(snapshot.snapshot_path_for(path)) == metadata
+
+
+def test_stale_snapshot_is_not_converted(built, monkeypatch):
+    path, _ = built
+    monkeypatch.setattr(snapshot.feather, 'read_table', lambda *args, **kwargs: pytest.fail('columns read'))
+    assert snapshot.load_snapshot(path, 'another export') is None
+
+
+def test_streamed_snapshot_matches_whole_file(built, tmp_path):
+    path, metadata = built
+    whole = snapshot.load_snapshot(path, metadata['source_hash'])
+    whole_rows = snapshot.read_row_index(path, metadata['source_hash'])
+    streamed_path = str(tmp_path / 'streamed.feather')
+    streamed_metadata = snapshot.build_snapshot(path, streamed_path, chunk_size=500)
+    assert streamed_metadata['rows'] == metadata['rows']
+    assert streamed_metadata['duplicates'] == metadata['duplicates']
+    pd.testing.assert_frame_equal(snapshot.load_snapshot(path, metadata['source_hash'], streamed_path), whole)
+    streamed_rows = snapshot.read_row_index(path, metadata['source_hash'])
+    assert np.array_equal(streamed_rows.hashes, whole_rows.hashes)
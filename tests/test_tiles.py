@@ -0,0 +1,40 @@
+# ========================================
+# Import libraries
+# ========================================
+import numpy          as np
+import pytest
+
+from dishy.tiles      import PointPyramid
+
+
+@pytest.fixture(scope='module')
+def points():
+    rng = np.random.default_rng(0)
+    return rng.uniform(-60, 70, 20_000), rng.uniform(-180, 180, 20_000)
+
+
+@pytest.mark.parametrize('zoom', [0, 4, 9, 16])
+def test_clusters_cover_the_filtered_points(points, zoom):
+    latitude, longitude = points
+    mask     = np.random.default_rng(1).random(len(latitude)) < 0.3
+    clusters = PointPyramid(latitude, longitude).clusters(zoom, mask=mask, key='half')
+    assert clusters['n_restaurant'].sum() == mask.sum()
+    assert np.isclose((clusters['latitude'] * clusters['n_restaurant']).sum(), latitude[mask].sum())
+
+
+def test_single_tile_matches_its_points(points):
+    latitude, longitude = points
+    pyramid  = PointPyramid(latitude, longitude)
+    clusters = pyramid.clusters(1, bounds=(1, 1, 60, 170))
+    inside   = (latitude > 0) & (longitude > 0)
+    assert clusters['n_restaurant'].tolist() == [inside.sum()]
+    assert np.isclose(clusters['longitude'].iloc[0], longitude[inside].mean())
+
+
+def test_tile_sums_cache_is_bounded(points, monkeypatch):
+    monkeypatch.setattr('dishy.tiles.TILE_SUMS_BYTES', 64 * 1024)
+    pyramid = PointPyramid(*points)
+    for key in range(20):
+        pyramid.tile_sums(16, np.ones(pyramid.n_rows, dtype=bool), key)
+        pyramid.tile_sums(3, np.ones(pyramid.n_rows, dtype=bool), key)
+    assert pyramid._sums_bytes <= 64 * 1024
@@ -0,0 +1,34 @@
+# ========================================
+# Import libraries
+# ========================================
+import numpy          as np
+import pandas         as pd
+import pytest
+
+from dishy.topk       import top_k
+
+
+@pytest.fixture
+def ranked():
+    # Few distinct values, so most of the top k is decided by ties
+    rng = np.random.default_rng(0)
+    n   = 2_000
+    rating = np.round(rng.uniform(0, 5, n) * 2) / 2
+    rating[rng.choice(n, 50, replace=False)] = np.nan
+    return pd.DataFrame({
+        'aggregate_rating': rating.astype(np.float32),
+        'votes':            rng.integers(0, 20, n),
+        'restaurant_id':    np.arange(n),
+    }, index=rng.permutation(n))
+
+
+@pytest.mark.parametrize('by, ascending', [
+    ('aggregate_rating', False),
+    ('aggregate_rating', True),
+    (['aggregate_rating', 'votes'], False),
+    (['aggregate_rating', 'votes'], [False, True]),
+])
+@pytest.mark.parametrize('k', [0, 1, 15, 1_999, 2_000, 5_000])
+def test_top_k_matches_stable_sort(ranked, by, ascending, k):
+    expected = ranked.sort_values(by, ascending=ascending, kind='stable').head(k)
+    pd.testing.assert_frame_equal(top_k(ranked, by, k, ascending), expected)
@@ -0,0 +1,27 @@
+# ========================================
+# Import libraries
+# ========================================
+from dishy.trace      import Span, to_prometheus
+
+
+# Sample name suffixes each Prometheus metric type may expose
+SUFFIXES = {'counter': [''], 'gauge': [''], 'summary': ['_sum', '_count']}
+
+
+def test_prometheus_samples_match_declared_types():
+    spans = [Span('csv_read'), Span('csv_read'), Span('clean_code')]
+    for span in spans:
+        span.seconds, span.rows_out, span.memory = 0.5, 10, -1024
+    types, samples = {}, []
+    for line in to_prometheus(spans).splitlines():
+        if line.startswith('# TYPE'):
+            _, _, metric, kind = line.split()
+            types[metric] = kind
+        elif not line.startswith('#'):
+            samples.append(line.split('{')[0])
+
+    assert samples
+    for sample in samples:
+        assert any(sample == metric + suffix for metric, kind in types.items() for suffix in SUFFIXES[kind])
+    for metric, kind in types.items():
+        assert (kind == 'counter') == metric.endswith('_total')